@@ -7,8 +7,18 @@ import os
 import discord
 from discord.ext import commands
 
-from database import initialize_database
+from database import (
+    init_pool,
+    close_pool,
+    initialize_database,
+    backfill_message_logs,
+    load_excluded_channels,
+    load_stored_roles,
+)
 from cogs import COG_EXTENSIONS
+from utils.http import HttpClient
+from utils.render import RenderEngine
+from utils.render_cache import RenderCache
 
 # Setup logging
 _log_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
@@ -54,6 +64,13 @@ async def on_ready():
         logging.error(f"Failed to sync commands: {e}")
 
 
+@bot.event
+async def on_message(message):
+    # Replaces Bot.on_message: prefix commands are dispatched once, by the
+    # Moderation cog's message pipeline, after the banned word check
+    pass
+
+
 async def main():
     from dotenv import load_dotenv
 
@@ -76,6 +93,32 @@ async def main():
         )
         return
 
+    try:
+        await init_pool()
+        await initialize_database()
+        await load_excluded_channels()
+        await load_stored_roles()
+    except Exception as e:
+        logging.error(f"Database connection failed: {e}")
+        logging.error(
+            "Ensure PostgreSQL is running. If using Docker: docker compose up db -d\n"
+            "When running locally, set POSTGRES_HOST=localhost in .env"
+        )
+        raise
+
+    # Migrate legacy message logs in the background while the bot runs
+    backfill_task = asyncio.create_task(backfill_message_logs())
+
+    # Shared HTTP session for the cogs (image downloads, fun APIs)
+    bot.http_client = HttpClient()
+    await bot.http_client.start()
+    # Pillow work for the image context menus runs in worker processes
+    bot.render_engine = RenderEngine()
+    await bot.render_engine.start()
+    # Text overlays rendered before are reused from memory or app/data
+    bot.render_cache = RenderCache()
+    await bot.render_cache.start()
+
     # Load cogs
     for extension in COG_EXTENSIONS:
         try:
@@ -84,20 +127,17 @@ async def main():
         except Exception as e:
             logging.error(f"Failed to load extension {extension}: {e}")
 
-    await bot.start(bot_token)
+    try:
+        await bot.start(bot_token)
+    finally:
+        backfill_task.cancel()
+        await bot.http_client.close()
+        await bot.render_engine.close()
+        logging.info(f"Render cache: {bot.render_cache.stats()}")
+        await close_pool()
 
 
 if __name__ == "__main__":
-    try:
-        initialize_database()
-    except Exception as e:
-        logging.error(f"Database connection failed: {e}")
-        logging.error(
-            "Ensure PostgreSQL is running. If using Docker: docker compose up db -d\n"
-            "When running locally, set POSTGRES_HOST=localhost in .env"
-        )
-        raise
-
     asyncio.run(main())
     if os.path.exists("log_once_per_session.txt"):
         os.remove("log_once_per_session.txt")
@@ -7,11 +7,9 @@ from discord import app_commands
 from discord.ext import commands
 
 from config import WAITING_ROOM_SERVER_ID
-from database import get_db_connection
+from database import health_check, get_stored_roles_for_user
 from utils.checks import is_owner
 
-from state import banned_users_roles
-
 
 class Admin(commands.Cog):
     def __init__(self, bot):
@@ -36,8 +34,11 @@ class Admin(commands.Cog):
 
     @app_commands.command(name="ping", description="Returns the bot's latency")
     async def ping_slash(self, interaction: discord.Interaction):
+        db_latency = await health_check()
+        db_status = f"{round(db_latency)}ms" if db_latency is not None else "unreachable"
         await interaction.response.send_message(
-            f"Pong! {round(self.bot.latency * 1000)}ms", ephemeral=True
+            f"Pong! {round(self.bot.latency * 1000)}ms (database: {db_status})",
+            ephemeral=True,
         )
 
     @app_commands.command(name="owner", description="This command is only for the owner of the server")
@@ -159,8 +160,16 @@ class Admin(commands.Cog):
     async def check_stored_roles(self, interaction: discord.Interaction, user_id: str):
         try:
             user_id = int(user_id)
-            if user_id in banned_users_roles:
-                roles_info = banned_users_roles[user_id]
+            stored = get_stored_roles_for_user(user_id)
+            if stored:
+                lines = []
+                for guild_id, (role_ids, stored_at) in stored.items():
+                    guild = self.bot.get_guild(guild_id)
+                    guild_name = guild.name if guild else guild_id
+                    lines.append(
+                        f"{guild_name} (stored {stored_at:%Y-%m-%d %H:%M} UTC): {role_ids}"
+                    )
+                roles_info = "\n".join(lines)
                 await interaction.response.send_message(
                     f"Stored roles for user {user_id}:\n```\n{roles_info}\n```",
                     ephemeral=True,
@@ -21,7 +21,7 @@ async def name_autocompletion(
 ) -> typing.List[app_commands.Choice[str]]:
     action = interaction.namespace.action
     data = []
-    birthdays = load_birthdays_from_db()
+    birthdays = await load_birthdays_from_db()
 
     if action == "add":
         for member in interaction.guild.members:
@@ -68,7 +68,7 @@ class Birthday(commands.Cog):
             if action == "add":
                 if name and birthdate:
                     birthdate = parse(birthdate).strftime("%d-%m-%Y")
-                    save_birthday_to_db(name, birthdate)
+                    await save_birthday_to_db(name, birthdate)
                     embed = Embed(
                         title="🎉 Birthday Added",
                         description=f"Added birthday for **{name}** on {birthdate}",
@@ -86,7 +86,7 @@ class Birthday(commands.Cog):
 
             elif action == "delete":
                 if name:
-                    delete_birthday_from_db(name)
+                    await delete_birthday_from_db(name)
                     embed = Embed(
                         title="🗑️ Birthday Deleted",
                         description=f"Deleted birthday for **{name}**",
@@ -103,7 +103,7 @@ class Birthday(commands.Cog):
                 )
 
             elif action == "display":
-                birthdays = load_birthdays_from_db()
+                birthdays = await load_birthdays_from_db()
                 if name:
                     if name in birthdays:
                         embed = Embed(
@@ -134,7 +134,7 @@ class Birthday(commands.Cog):
 
             elif action == "next":
                 if name:
-                    birthdays = load_birthdays_from_db()
+                    birthdays = await load_birthdays_from_db()
                     if name in birthdays:
                         birthdate = datetime.strptime(
                             birthdays[name], "%d-%m-%Y"
@@ -4,7 +4,6 @@ import typing
 from datetime import datetime, timedelta
 
 import discord
-import requests
 from discord import app_commands
 from discord.ext import commands
 
@@ -29,8 +28,9 @@ class Fun(commands.Cog):
     async def joke_slash(
         self, interaction: discord.Interaction, hide_message: bool = True
     ):
-        response = requests.get("https://official-joke-api.appspot.com/random_joke")
-        data = response.json()
+        data = await self.bot.http_client.get_json(
+            "https://official-joke-api.appspot.com/random_joke"
+        )
         joke = f"{data['setup']}\n{data['punchline']}"
         await interaction.response.send_message(joke, ephemeral=hide_message)
 
@@ -44,10 +44,9 @@ class Fun(commands.Cog):
         number_of_images = max(min(number_of_images, 5), 1)
 
         for i in range(number_of_images):
-            response = requests.get(
+            data = await self.bot.http_client.get_json(
                 "https://api.thecatapi.com/v1/images/search?category_ids=1"
             )
-            data = response.json()
             cat_image_url = data[0]["url"]
             embed = discord.Embed(title="Cute Cat")
             embed.set_image(url=cat_image_url)
@@ -77,11 +76,10 @@ class Fun(commands.Cog):
         else:
             base_url = "http://api.openweathermap.org/data/2.5/weather"
 
-        response = requests.get(
+        data = await self.bot.http_client.get_json(
             base_url,
             params={"q": city, "appid": api_weather, "units": "metric"},
         )
-        data = response.json()
 
         if int(data["cod"]) != 200:
             await interaction.response.send_message(
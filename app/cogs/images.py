@@ -1,16 +1,22 @@
 """Image context menus: add text, emoji, sticker."""
 
+import asyncio
 import io
-import os
 import random
 import re
 import string
 
+import aiohttp
 import discord
-import requests
-from PIL import Image, ImageDraw, ImageFont, ImageSequence
 from discord import app_commands
 
+from utils import imaging
+from utils.http import DownloadTooLarge
+from utils.imaging import ImageError
+from utils.render import RenderTimeout
+from utils.render_cache import cache_key, digest
+
+
 def find_urls_in_string(s):
     # Simple, robust URL pattern (avoids regex errors from complex patterns)
     regex = r"https?://[^\s<>\"']+|www\.[^\s<>\"']+"
@@ -18,51 +24,52 @@ def find_urls_in_string(s):
     return urls
 
 
-def get_fitting_font(text, image, draw, font_path):
-    """Get font that fits the image, scaling dynamically with image size."""
-    min_dim = min(image.size[0], image.size[1])
-    # Base size: ~15% of smaller dimension (scales with image)
-    base_font_size = max(60, int(min_dim * 0.15))
-    base_font_size = min(280, base_font_size)  # Cap for very large images
-    min_font_size = max(24, int(min_dim * 0.05))  # Min ~5% of dimension
-
-    font_size = base_font_size
-    font = ImageFont.truetype(font_path, font_size)
-    text_bbox = draw.textbbox((0, 0), text, font=font)
-    text_width = text_bbox[2] - text_bbox[0]
-    text_height = text_bbox[3] - text_bbox[1]
+async def download(interaction, url):
+    """Download ``url`` with the bot's shared HTTP client; returns (bytes, content type)."""
+    content, content_type, _ = await interaction.client.http_client.fetch(
+        url, headers=_IMAGE_HEADERS
+    )
+    return content, content_type
 
-    # Allow text up to 90% width and 50% height
-    while (
-        text_width > image.size[0] * 0.9 or text_height > image.size[1] * 0.5
-    ) and font_size > min_font_size:
-        font_size -= 1
-        font = ImageFont.truetype(font_path, font_size)
-        text_bbox = draw.textbbox((0, 0), text, font=font)
-        text_width = text_bbox[2] - text_bbox[0]
-        text_height = text_bbox[3] - text_bbox[1]
 
-    return font, text_width, text_height
+async def download_attachment(interaction, attachment):
+    """Download an attachment after ``defer()``; returns its bytes, or None
+    after telling the user why it failed."""
+    try:
+        content, _ = await download(interaction, attachment.url)
+    except aiohttp.ClientResponseError as e:
+        await interaction.followup.send(
+            f"Failed to download content, status code: {e.status}",
+            ephemeral=True,
+        )
+    except DownloadTooLarge:
+        await interaction.followup.send(
+            "The file is too large to process.", ephemeral=True
+        )
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        await interaction.followup.send(
+            "Failed to download content, please try again later.", ephemeral=True
+        )
+    else:
+        return content
+    return None
 
 
 async def process_attachment(interaction, attachment, text):
+    is_gif = attachment.content_type == "image/gif"
+    # Attachments never change, so a cached render needs no download at all
+    key = text_cache_key(f"attachment:{attachment.id}", text, is_gif)
     try:
-        response = requests.get(
-            attachment.url, timeout=15, headers=_IMAGE_HEADERS
-        )
-        if response.status_code != 200:
-            await interaction.followup.send(
-                f"Failed to download content, status code: {response.status_code}",
-                ephemeral=True,
-            )
+        if await send_cached(interaction, key):
+            return
+        content = await download_attachment(interaction, attachment)
+        if content is None:
             return
 
-        if attachment.content_type == "image/gif":
-            gif_bytes = io.BytesIO(response.content)
-            await process_gif(interaction, gif_bytes, text)
+        if is_gif:
+            await process_gif(interaction, content, text, key)
         else:
-            image_bytes = io.BytesIO(response.content)
-            await process_image(interaction, image_bytes, text)
+            await process_image(interaction, content, text, key)
     except Exception as e:
         await interaction.followup.send(
             f"An error occurred while processing the attachment: {e}",
@@ -80,126 +87,99 @@ _IMAGE_HEADERS = {
 
 async def process_image_url(interaction, url, text, is_gif=False):
     """Fetch URL and process image/GIF. Raises on failure (caller can try next URL)."""
-    response = requests.get(
-        url, timeout=15, headers=_IMAGE_HEADERS, stream=True
-    )
-    response.raise_for_status()
-    content = response.content
+    content, content_type = await download(interaction, url)
 
     # Validate we got image data (some URLs return HTML error pages)
     if not content or len(content) < 100:
         raise ValueError("URL did not return valid image data")
 
     # Auto-detect GIF from Content-Type (Discord CDN doesn't always have .gif in URL)
-    content_type = response.headers.get("Content-Type", "").lower()
-    if "gif" in content_type:
+    if "gif" in content_type.lower():
         is_gif = True
 
-    image_bytes = io.BytesIO(content)
     if is_gif:
-        await process_gif(interaction, image_bytes, text)
+        await process_gif(interaction, content, text)
     else:
-        await process_image(interaction, image_bytes, text)
+        await process_image(interaction, content, text)
 
 
-async def process_image(interaction, image_bytes, text):
+async def render(interaction, func, *args):
+    """Run an imaging function on the bot's render engine.
+
+    Returns its result, or None after telling the user why it failed.
+    """
     try:
-        img = Image.open(image_bytes)
-    except Exception as e:
+        return await interaction.client.render_engine.run(func, *args)
+    except ImageError as e:
+        await interaction.followup.send(str(e), ephemeral=True)
+    except RenderTimeout:
         await interaction.followup.send(
-            "Could not open image. The URL may not point to a valid image file.",
-            ephemeral=True,
+            "This image took too long to process.", ephemeral=True
         )
-        return
+    return None
 
-    with img:
-        draw = ImageDraw.Draw(img)
-        font_path = os.path.join(os.getcwd(), "data", "Roboto-Bold.ttf")
-        font, text_width, text_height = get_fitting_font(
-            text, img, draw, font_path
-        )
-        x = (img.width - text_width) / 2
-        y = (img.height - text_height) / 2
-        draw.text((x, y), text, fill="white", font=font)
 
-        output_buffer = io.BytesIO()
-        img.save(output_buffer, format="PNG")
-        output_buffer.seek(0)
+def text_cache_key(source, text, is_gif):
+    if is_gif:
+        # The output depends on which formats are allowed
+        renderer = f"render_text_animation:{','.join(imaging.ANIMATION_FORMATS)}"
+    else:
+        renderer = "render_text_image"
+    return cache_key(source, renderer, text, imaging.RENDERER_VERSION)
+
+
+async def send_cached(interaction, key):
+    """Send the cached render for ``key`` if there is one; returns True if sent."""
+    cached = await interaction.client.render_cache.get(key)
+    if cached is None:
+        return False
+    output, filename = cached
+    await interaction.followup.send(
+        file=discord.File(fp=io.BytesIO(output), filename=filename)
+    )
+    return True
+
+
+async def render_text(interaction, func, content, text, filename, key):
+    """Render ``text`` onto ``content``, send it and cache it under ``key``.
+
+    ``filename`` is used as is, or as the stem when ``func`` returns
+    ``(bytes, extension)``.
+    """
+    output = await render(interaction, func, content, text)
+    if isinstance(output, tuple):
+        output, extension = output
+        filename = f"{filename}.{extension}"
+    if output is not None:
         await interaction.followup.send(
-            file=discord.File(fp=output_buffer, filename="edited_image.png")
+            file=discord.File(fp=io.BytesIO(output), filename=filename)
         )
+        await interaction.client.render_cache.put(key, output, filename)
 
 
-async def process_gif(interaction, gif_bytes, text):
-    try:
-        with Image.open(gif_bytes) as img:
-            if img.format != "GIF":
-                raise ValueError("Not a valid GIF format")
-
-            # RGBA images only support Fast Octree (2) or libimagequant (3).
-            # Use Fast Octree - no extra deps, good quality with FLOYDSTEINBERG dithering.
-            try:
-                method = Image.Quantize.FASTOCTREE
-                dither = Image.Dither.FLOYDSTEINBERG
-            except AttributeError:
-                method = Image.FASTOCTREE
-                dither = Image.FLOYDSTEINBERG
-
-            frames = []
-            durations = []
-            disposals = []
-            for frame in ImageSequence.Iterator(img):
-                duration = frame.info.get("duration", img.info.get("duration", 100))
-                disposal = frame.info.get("disposal", 2)
-                frame = frame.convert("RGBA")
-                draw = ImageDraw.Draw(frame)
-                font_path = os.path.join(os.getcwd(), "data", "Roboto-Bold.ttf")
-                font, text_width, text_height = get_fitting_font(
-                    text, frame, draw, font_path
-                )
-                x = (frame.width - text_width) / 2
-                y = (frame.height - text_height) / 2
-                draw.text((x, y), text, fill="white", font=font)
-                frames.append(frame.copy())
-                durations.append(duration)
-                disposals.append(disposal)
-
-            # quantize(palette=...) requires RGB or L mode, not RGBA
-            def to_rgb(f):
-                if f.mode == "RGBA":
-                    rgb = Image.new("RGB", f.size, (255, 255, 255))
-                    rgb.paste(f, mask=f.split()[3])
-                    return rgb
-                return f.convert("RGB")
-
-            rgb_frames = [to_rgb(f) for f in frames]
-
-            # Quantize with Fast Octree palette + FLOYDSTEINBERG dithering
-            # Use consistent palette across all frames to avoid flickering
-            first_quantized = rgb_frames[0].quantize(
-                colors=256, method=method, dither=dither
-            )
-            quantized_frames = [first_quantized]
-            for frame in rgb_frames[1:]:
-                qf = frame.quantize(palette=first_quantized, dither=dither)
-                quantized_frames.append(qf)
-
-            output_buffer = io.BytesIO()
-            quantized_frames[0].save(
-                output_buffer,
-                format="GIF",
-                save_all=True,
-                append_images=quantized_frames[1:],
-                duration=durations,
-                loop=img.info.get("loop", 0),
-                disposal=disposals,
-                optimize=False,
-            )
-            output_buffer.seek(0)
+async def process_image(interaction, image_bytes, text, key=None):
+    """``key`` is passed by callers that already looked it up in the cache."""
+    if key is None:
+        key = text_cache_key(digest(image_bytes), text, is_gif=False)
+        if await send_cached(interaction, key):
+            return
+    await render_text(
+        interaction, imaging.render_text_image, image_bytes, text,
+        "edited_image.png", key,
+    )
 
-            await interaction.followup.send(
-                file=discord.File(fp=output_buffer, filename="edited_image.gif")
-            )
+
+async def process_gif(interaction, gif_bytes, text, key=None):
+    """``key`` is passed by callers that already looked it up in the cache."""
+    try:
+        if key is None:
+            key = text_cache_key(digest(gif_bytes), text, is_gif=True)
+            if await send_cached(interaction, key):
+                return
+        await render_text(
+            interaction, imaging.render_text_animation, gif_bytes, text,
+            "edited_image", key,
+        )
     except Exception as e:
         await interaction.followup.send(
             f"An error occurred while processing the GIF: {e}", ephemeral=True
@@ -209,11 +189,8 @@ async def process_gif(interaction, gif_bytes, text):
 async def process_sticker(interaction, sticker, text):
     try:
         sticker_url = sticker.url if hasattr(sticker, "url") else sticker.image_url
-        response = requests.get(
-            sticker_url, timeout=15, headers=_IMAGE_HEADERS
-        )
-        sticker_bytes = io.BytesIO(response.content)
-        await process_image(interaction, sticker_bytes, text)
+        content, _ = await download(interaction, sticker_url)
+        await process_image(interaction, content, text)
     except Exception as e:
         await interaction.followup.send(
             f"An error occurred while processing the sticker: {e}",
@@ -249,7 +226,7 @@ async def _process_url(interaction, url, text):
             return True
         await process_image_url(interaction, url, text)
         return True
-    except (requests.RequestException, ValueError, Exception):
+    except Exception:
         # URL failed (404, invalid data, etc.) - caller can try next URL
         return False
 
@@ -342,51 +319,48 @@ async def image_to_emoji(
         attachment = message.attachments[0]
         if attachment.content_type.startswith("image/"):
             await interaction.response.defer(ephemeral=True)
-            response = requests.get(attachment.url, headers=_IMAGE_HEADERS)
-            image_bytes = io.BytesIO(response.content)
-
-            with Image.open(image_bytes) as img:
-                img.thumbnail((128, 128), Image.LANCZOS)
-                output_buffer = io.BytesIO()
-                img.save(output_buffer, format="PNG", optimize=True)
-                output_buffer.seek(0)
-
-                if output_buffer.getbuffer().nbytes > 256 * 1024:
+            content = await download_attachment(interaction, attachment)
+            if content is None:
+                return
+            # Encoded under Discord's 256 KB emoji limit (or ImageError);
+            # GIFs become animated emoji
+            if attachment.content_type == "image/gif":
+                resize = imaging.resize_animated_emoji
+            else:
+                resize = imaging.resize_emoji
+            rendered = await render(interaction, resize, content)
+            if rendered is None:
+                return
+            output, extension = rendered
+
+            guild = interaction.guild
+            if guild is None:
+                # DM: can't create server emoji, send resized image instead
+                await interaction.followup.send(
+                    "Emoji creation only works in servers. Here's your resized image (128×128):",
+                    file=discord.File(
+                        fp=io.BytesIO(output), filename=f"emoji_preview.{extension}"
+                    ),
+                    ephemeral=True,
+                )
+            else:
+                try:
+                    emoji = await guild.create_custom_emoji(
+                        name="".join(
+                            random.choices(
+                                string.ascii_letters + string.digits, k=5
+                            )
+                        ),
+                        image=output,
+                    )
                     await interaction.followup.send(
-                        "Image is too large to be uploaded as an emoji (must be under 256 KB).",
+                        f"Emoji created successfully: <:{emoji.name}:{emoji.id}>",
                         ephemeral=True,
                     )
-                    return
-
-                output_buffer.seek(0)
-                guild = interaction.guild
-                if guild is None:
-                    # DM: can't create server emoji, send resized image instead
+                except discord.HTTPException as e:
                     await interaction.followup.send(
-                        "Emoji creation only works in servers. Here's your resized image (128×128):",
-                        file=discord.File(
-                            fp=output_buffer, filename="emoji_preview.png"
-                        ),
-                        ephemeral=True,
+                        f"Failed to create emoji: {e}", ephemeral=True
                     )
-                else:
-                    try:
-                        emoji = await guild.create_custom_emoji(
-                            name="".join(
-                                random.choices(
-                                    string.ascii_letters + string.digits, k=5
-                                )
-                            ),
-                            image=output_buffer.read(),
-                        )
-                        await interaction.followup.send(
-                            f"Emoji created successfully: <:{emoji.name}:{emoji.id}>",
-                            ephemeral=True,
-                        )
-                    except discord.HTTPException as e:
-                        await interaction.followup.send(
-                            f"Failed to create emoji: {e}", ephemeral=True
-                        )
         else:
             await interaction.response.send_message(
                 "The attachment is not an image.", ephemeral=True
@@ -404,35 +378,16 @@ async def image_to_sticker(
     if message.attachments:
         attachment = message.attachments[0]
         if attachment.content_type.startswith("image/"):
-            response = requests.get(
-                attachment.url, timeout=15, headers=_IMAGE_HEADERS
-            )
-            image_bytes = io.BytesIO(response.content)
-
-            with Image.open(image_bytes) as img:
-                output_buffer = io.BytesIO()
-                img.save(output_buffer, format="PNG", optimize=True)
-                output_buffer.seek(0)
-
-                if output_buffer.getbuffer().nbytes > 512 * 1024:
-                    quality = 85
-                    while (
-                        output_buffer.getbuffer().nbytes > 512 * 1024
-                        and quality > 10
-                    ):
-                        output_buffer = io.BytesIO()
-                        img.convert("RGB").save(
-                            output_buffer,
-                            format="JPEG",
-                            quality=quality,
-                            optimize=True,
-                        )
-                        output_buffer.seek(0)
-                        quality -= 5
-
-                await interaction.response.send_message(
+            await interaction.response.defer()
+            content = await download_attachment(interaction, attachment)
+            if content is None:
+                return
+            rendered = await render(interaction, imaging.compress_sticker, content)
+            if rendered is not None:
+                output, extension = rendered
+                await interaction.followup.send(
                     file=discord.File(
-                        fp=output_buffer, filename="resized_image.png"
+                        fp=io.BytesIO(output), filename=f"resized_image.{extension}"
                     )
                 )
         else:
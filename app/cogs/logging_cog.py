@@ -1,20 +1,31 @@
-"""Logging commands: manage_logging_channels, read_logs, delete_all_logs, LogEmbed."""
+"""Logging commands: manage_logging_channels, read_logs, search_logs, message_history, delete_all_logs, purge_logs, LogEmbed."""
 
-import json
+import logging
 import typing
-from datetime import datetime
+from datetime import datetime, timezone
 
 import discord
-from discord import Embed, Interaction, SelectOption, app_commands, ui, ButtonStyle
-from discord.ext import commands
+from discord import Embed, Interaction, app_commands, ui, ButtonStyle
+from discord.ext import commands, tasks
+from dateutil.parser import parse
 
+from config import EXCLUDED_CHANNELS_REFRESH_SECONDS
 from database import (
-    get_db_connection,
+    get_excluded_channels,
     load_excluded_channels,
+    fetch_message_log_page,
+    fetch_message_history,
+    search_message_logs,
+    estimate_message_log_count,
+    delete_all_message_logs,
+    create_upcoming_log_partitions,
+    drop_expired_log_partitions,
+    drop_log_partitions_before,
     add_logging_channel,
     remove_logging_channel,
 )
 from utils.checks import is_owner
+from utils.text_diff import rebuild_versions
 
 
 async def action_autocomplete(
@@ -32,7 +43,7 @@ async def channel_autocomplete(
     interaction: discord.Interaction, current: str
 ) -> typing.List[app_commands.Choice[str]]:
     action = interaction.namespace.action
-    excluded_channels = load_excluded_channels()
+    excluded_channels = get_excluded_channels()
     if action == "remove":
         return [
             app_commands.Choice(
@@ -52,53 +63,152 @@ async def channel_autocomplete(
         ]
 
 
+PAGE_SIZE = 25
+
+
+def parse_utc_date(text):
+    """Parse a user-supplied date; naive values are taken as UTC."""
+    try:
+        moment = parse(text)
+    except OverflowError as e:
+        raise ValueError(str(e)) from e
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment
+
+
+class JumpModal(ui.Modal, title="Jump to logs"):
+    page = ui.TextInput(label="Page number", required=False, max_length=10)
+    when = ui.TextInput(
+        label="Or a date/time (UTC), e.g. 2024-05-01 18:00",
+        required=False,
+        max_length=40,
+    )
+
+    def __init__(self, log_view):
+        super().__init__()
+        self.log_view = log_view
+
+    async def on_submit(self, interaction: Interaction):
+        if self.page.value:
+            try:
+                page = int(self.page.value)
+            except ValueError:
+                await interaction.response.send_message(
+                    "Please enter a valid page number.", ephemeral=True
+                )
+                return
+            await self.log_view.jump_to_page(interaction, page)
+        elif self.when.value:
+            try:
+                when = parse_utc_date(self.when.value)
+            except ValueError:
+                await interaction.response.send_message(
+                    "Could not understand that date.", ephemeral=True
+                )
+                return
+            await self.log_view.jump_to_time(interaction, when)
+        else:
+            await interaction.response.send_message(
+                "Enter a page number or a date.", ephemeral=True
+            )
+
+
 class LogEmbed(ui.View):
-    def __init__(self, logs):
+    """Log viewer that fetches one page at a time, newest first.
+
+    Only the visible page is kept in memory; Previous/Next run a keyset
+    query from the first/last row shown.
+    """
+
+    def __init__(self, total_logs):
         super().__init__()
-        self.logs = logs
-        self.current_page = 0
-        self.total_pages = (len(logs) + 24) // 25
-        self.add_page_selector()
+        self.logs = []
+        # None once we jumped to a point in time and lost track of the number
+        self.current_page = 1
+        self.total_pages = max(1, (total_logs + PAGE_SIZE - 1) // PAGE_SIZE)
+
+    async def fetch_page(self, before=None, after=None, at=None, offset=0):
+        return await fetch_message_log_page(
+            before=before, after=after, at=at, offset=offset, limit=PAGE_SIZE
+        )
+
+    async def load_first_page(self):
+        self.logs = await self.fetch_page()
+        return bool(self.logs)
+
+    @staticmethod
+    def cursor(log):
+        return log["created_at"], log["id"]
 
     @ui.button(label="Previous", style=ButtonStyle.primary)
     async def previous_button(self, interaction: Interaction, button: ui.Button):
-        if self.current_page > 0:
-            self.current_page -= 1
-            await interaction.response.edit_message(embed=self.get_embed(), view=self)
-        else:
+        logs = []
+        if self.current_page != 1 and self.logs:
+            logs = await self.fetch_page(after=self.cursor(self.logs[0]))
+        if not logs:
             await interaction.response.send_message(
                 "You are already on the first page.", ephemeral=True
             )
+            return
+        self.logs = logs
+        if self.current_page is not None:
+            self.current_page -= 1
+        await interaction.response.edit_message(embed=self.get_embed(), view=self)
 
     @ui.button(label="Next", style=ButtonStyle.primary)
     async def next_button(self, interaction: Interaction, button: ui.Button):
-        if self.current_page < self.total_pages - 1:
-            self.current_page += 1
-            await interaction.response.edit_message(embed=self.get_embed(), view=self)
-        else:
+        logs = []
+        if self.logs:
+            logs = await self.fetch_page(before=self.cursor(self.logs[-1]))
+        if not logs:
             await interaction.response.send_message(
                 "You are already on the last page.", ephemeral=True
             )
+            return
+        self.logs = logs
+        if self.current_page is not None:
+            self.current_page += 1
+            self.total_pages = max(self.total_pages, self.current_page)
+        await interaction.response.edit_message(embed=self.get_embed(), view=self)
 
-    @ui.select(placeholder="Select a page...", options=[])
-    async def select_page(self, interaction: Interaction, select: ui.Select):
-        self.current_page = int(select.values[0])
+    @ui.button(label="Jump to...", style=ButtonStyle.secondary)
+    async def jump_button(self, interaction: Interaction, button: ui.Button):
+        await interaction.response.send_modal(JumpModal(self))
+
+    async def jump_to_page(self, interaction: Interaction, page):
+        logs = []
+        if page >= 1:
+            logs = await self.fetch_page(offset=(page - 1) * PAGE_SIZE)
+        if not logs:
+            await interaction.response.send_message(
+                f"Page {page} does not exist.", ephemeral=True
+            )
+            return
+        self.logs = logs
+        self.current_page = page
+        self.total_pages = max(self.total_pages, page)
         await interaction.response.edit_message(embed=self.get_embed(), view=self)
 
-    def add_page_selector(self):
-        options = [
-            SelectOption(label=str(i + 1), value=str(i))
-            for i in range(self.total_pages)
-        ]
-        self.select_page.options = options
+    async def jump_to_time(self, interaction: Interaction, when):
+        logs = await self.fetch_page(at=when)
+        if not logs:
+            await interaction.response.send_message(
+                "No logs found before that date.", ephemeral=True
+            )
+            return
+        self.logs = logs
+        self.current_page = None
+        await interaction.response.edit_message(embed=self.get_embed(), view=self)
+
+    def get_title(self):
+        if self.current_page is None:
+            newest = self.logs[0]["created_at"].strftime("%Y-%m-%d %H:%M")
+            return f"📝 Logs from {newest} 📝"
+        return f"📝 Logs Page {self.current_page}/~{self.total_pages} 📝"
 
     def get_embed(self):
-        start = self.current_page * 25
-        end = start + 25
-        embed = Embed(
-            title=f"📝 Logs Page {self.current_page + 1}/{self.total_pages} 📝",
-            color=0x4B0082,
-        )
+        embed = Embed(title=self.get_title(), color=0x4B0082)
         embed.timestamp = datetime.now()
         total_characters = 0
         embed.set_footer(text="Tess Spy Agency")
@@ -108,7 +218,8 @@ class LogEmbed(ui.View):
             inline=False,
         )
 
-        for i, log in enumerate(self.logs[start:end], start=start + 1):
+        start = ((self.current_page or 1) - 1) * PAGE_SIZE
+        for i, log in enumerate(self.logs, start=start + 1):
             formatted_log = self.format_log(log)
             total_characters += len(formatted_log)
             if total_characters > 6000:
@@ -125,12 +236,22 @@ class LogEmbed(ui.View):
         return embed
 
     def format_log(self, log):
-        user = log.get("user", "Unknown User")
-        message = log.get("message", "No message").strip()
-        time = log.get("time", "Unknown time")
-        attachments = log.get("attachments", "No attachments")
-        guild = log.get("guild", "Unknown guild")
-        channel = log.get("channel", "Unknown channel")
+        user = log["user_name"] or "Unknown User"
+        message = (log["content"] or "No message").strip()
+        if log["kind"] == "edit":
+            if log["content"] is None:
+                # Only a diff was stored, see /message_history
+                message = f"(edited, /message_history {log['message_id']})"
+            else:
+                message = f"(edited) {message}"
+        time = (
+            log["created_at"].strftime("%Y-%m-%d %H:%M:%S")
+            if log["created_at"]
+            else "Unknown time"
+        )
+        attachments = log["extras"].get("attachments", "No attachments")
+        guild = log["guild_name"] or "Unknown guild"
+        channel = log["channel_name"] or "Unknown channel"
 
         if len(message) > 100:
             message = message[:100] + "..."
@@ -150,10 +271,59 @@ class LogEmbed(ui.View):
         return formatted_log
 
 
+class SearchLogEmbed(LogEmbed):
+    """LogEmbed over the results of search_message_logs(), best match first."""
+
+    def __init__(self, search):
+        super().__init__(total_logs=0)
+        self.search = search
+        # Offsets and points in time mean nothing in a ranked result list
+        self.remove_item(self.jump_button)
+
+    async def fetch_page(self, before=None, after=None, at=None, offset=0):
+        return await search_message_logs(
+            **self.search, before=before, after=after, limit=PAGE_SIZE
+        )
+
+    @staticmethod
+    def cursor(log):
+        return log["rank"], log["created_at"], log["id"]
+
+    def get_title(self):
+        return f"🔎 Search Results Page {self.current_page} 🔎"
+
+
 class LoggingCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
+    def cog_load(self):
+        self.maintain_log_partitions.start()
+        if EXCLUDED_CHANNELS_REFRESH_SECONDS > 0:
+            self.refresh_excluded_channels.change_interval(
+                seconds=EXCLUDED_CHANNELS_REFRESH_SECONDS
+            )
+            self.refresh_excluded_channels.start()
+
+    def cog_unload(self):
+        self.maintain_log_partitions.cancel()
+        self.refresh_excluded_channels.cancel()
+
+    @tasks.loop(seconds=300)
+    async def refresh_excluded_channels(self):
+        try:
+            await load_excluded_channels()
+        except Exception as e:
+            logging.error(f"Error refreshing excluded logging channels: {e}")
+
+    @tasks.loop(hours=6)
+    async def maintain_log_partitions(self):
+        try:
+            await create_upcoming_log_partitions()
+            await drop_expired_log_partitions()
+        except Exception as e:
+            logging.error(f"Error maintaining message log partitions: {e}")
+
     @app_commands.command(
         name="manage_logging_channels",
         description="Manage the logging channels to not log messages from",
@@ -171,7 +341,7 @@ class LoggingCog(commands.Cog):
         channel: str = None,
         hide_message: bool = True,
     ):
-        channels = load_excluded_channels()
+        channels = get_excluded_channels()
 
         if action == "add":
             if channel is None:
@@ -182,7 +352,7 @@ class LoggingCog(commands.Cog):
 
             ch = interaction.guild.get_channel(int(channel))
             if ch.id not in channels:
-                add_logging_channel(ch.id)
+                await add_logging_channel(ch.id)
                 await interaction.response.send_message(
                     f"Added channel {ch.mention} to the list of channels to exclude from logging.",
                     ephemeral=hide_message,
@@ -202,7 +372,7 @@ class LoggingCog(commands.Cog):
 
             ch = interaction.guild.get_channel(int(channel))
             if ch.id in channels:
-                remove_logging_channel(ch.id)
+                await remove_logging_channel(ch.id)
                 await interaction.response.send_message(
                     f"Removed channel {ch.mention} from the list of channels to exclude from logging.",
                     ephemeral=hide_message,
@@ -238,16 +408,9 @@ class LoggingCog(commands.Cog):
     async def read_logs_slash(
         self, interaction: discord.Interaction, hide_message: bool = True
     ):
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT encoded_message FROM message_logs")
-        rows = cur.fetchall()
-        logs = [json.loads(row[0]) for row in rows]
-        cur.close()
-        conn.close()
-
-        if logs:
-            view = LogEmbed(logs)
+        view = LogEmbed(await estimate_message_log_count())
+
+        if await view.load_first_page():
             await interaction.response.send_message(
                 embed=view.get_embed(), view=view, ephemeral=hide_message
             )
@@ -256,6 +419,117 @@ class LoggingCog(commands.Cog):
                 "No valid logs found.", ephemeral=hide_message
             )
 
+    @app_commands.command(
+        name="search_logs", description="Search the content of the message logs"
+    )
+    @app_commands.describe(
+        query='Words to look for; supports "quoted phrases", or and -excluded words',
+        user="Only messages from this user",
+        channel="Only messages from this channel",
+        since="Only messages sent on or after this date (UTC)",
+        until="Only messages sent before this date (UTC)",
+        substring="Match any part of a word instead of whole words",
+    )
+    @is_owner()
+    async def search_logs_slash(
+        self,
+        interaction: discord.Interaction,
+        query: str,
+        user: discord.User = None,
+        channel: discord.TextChannel = None,
+        since: str = None,
+        until: str = None,
+        substring: bool = False,
+        hide_message: bool = True,
+    ):
+        try:
+            since_date = parse_utc_date(since) if since else None
+            until_date = parse_utc_date(until) if until else None
+        except ValueError:
+            await interaction.response.send_message(
+                "Could not understand that date.", ephemeral=True
+            )
+            return
+
+        await interaction.response.defer(ephemeral=hide_message)
+        view = SearchLogEmbed(
+            {
+                "text": query,
+                "substring": substring,
+                "user_id": user.id if user else None,
+                "channel_id": channel.id if channel else None,
+                "since": since_date,
+                "until": until_date,
+            }
+        )
+
+        if await view.load_first_page():
+            await interaction.followup.send(
+                embed=view.get_embed(), view=view, ephemeral=hide_message
+            )
+        else:
+            await interaction.followup.send(
+                f"No logs match **{query}**.", ephemeral=hide_message
+            )
+
+    @app_commands.command(
+        name="message_history",
+        description="Show every logged version of a message",
+    )
+    @app_commands.describe(message_id="ID of the message")
+    @is_owner()
+    async def message_history_slash(
+        self, interaction: discord.Interaction, message_id: str, hide_message: bool = True
+    ):
+        try:
+            message_id = int(message_id)
+            since = discord.utils.snowflake_time(message_id)
+        except (ValueError, OverflowError):
+            await interaction.response.send_message(
+                "Please provide a valid message ID (numbers only).", ephemeral=True
+            )
+            return
+
+        rows = await fetch_message_history(message_id, since)
+        if not rows:
+            await interaction.response.send_message(
+                f"No logs found for message {message_id}.", ephemeral=hide_message
+            )
+            return
+
+        first = rows[0]
+        embed = Embed(
+            title=f"📝 History of message {message_id} 📝",
+            description=(
+                f"**User**: {first['user_name'] or 'Unknown User'}\n"
+                f"**Channel**: {first['channel_name'] or 'Unknown channel'} "
+                f"({first['guild_name'] or 'Unknown guild'})"
+            ),
+            color=0x4B0082,
+        )
+        total_characters = len(embed.description)
+        edits = 0
+        for row, text in rebuild_versions(rows):
+            if row["kind"] == "edit":
+                edits += 1
+                name = f"Edit {edits}"
+            else:
+                name = "Original"
+            name += f" · {row['created_at']:%Y-%m-%d %H:%M:%S}"
+            if text is None:
+                value = "*Not available: an earlier version was not logged*"
+            else:
+                value = text.strip() or "*No text*"
+                if len(value) > 1024:
+                    value = value[:1021] + "..."
+            total_characters += len(name) + len(value)
+            if total_characters > 5900 or len(embed.fields) >= 25:
+                embed.set_footer(text="Later versions omitted: Discord embed limits reached")
+                break
+            embed.add_field(name=name, value=value, inline=False)
+
+        await interaction.response.send_message(embed=embed, ephemeral=hide_message)
+
     @app_commands.command(
         name="delete_all_logs",
         description="Delete the content of all the message logs",
@@ -264,17 +538,43 @@ class LoggingCog(commands.Cog):
     async def delete_all_logs_slash(
         self, interaction: discord.Interaction, hide_message: bool = True
     ):
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("DELETE FROM message_logs")
-        conn.commit()
-        cur.close()
-        conn.close()
+        await delete_all_message_logs()
 
         await interaction.response.send_message(
             "All logs have been deleted.", ephemeral=hide_message
         )
 
+    @app_commands.command(
+        name="purge_logs",
+        description="Delete the message logs of every month that ended before a date",
+    )
+    @app_commands.describe(
+        before="Date (UTC), e.g. 2024-05-01. Logs are dropped a whole month at a time"
+    )
+    @is_owner()
+    async def purge_logs_slash(
+        self, interaction: discord.Interaction, before: str, hide_message: bool = True
+    ):
+        try:
+            cutoff = parse_utc_date(before)
+        except ValueError:
+            await interaction.response.send_message(
+                "Could not understand that date.", ephemeral=True
+            )
+            return
+
+        dropped = await drop_log_partitions_before(cutoff)
+        if dropped:
+            months = ", ".join(f"{month:%Y-%m}" for month in dropped)
+            await interaction.response.send_message(
+                f"Deleted the logs of: {months}.", ephemeral=hide_message
+            )
+        else:
+            await interaction.response.send_message(
+                f"No whole month of logs ends before {cutoff:%Y-%m-%d}.",
+                ephemeral=hide_message,
+            )
+
 
 async def setup(bot):
     await bot.add_cog(LoggingCog(bot))
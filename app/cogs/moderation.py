@@ -1,233 +1,714 @@
-"""Moderation: banned words, temp bans, on_message, on_member_join."""
+"""Moderation: banned words, temp bans, on_message, on_member_join, manage_banned_words."""
 
 import asyncio
 import logging
+import re
+import typing
+from collections import OrderedDict
 
 import discord
+from discord import app_commands
 from discord.ext import commands, tasks
 from discord.utils import utcnow
 from datetime import timedelta
 
-from config import BANNED_WORDS, WAITING_ROOM_SERVER_ID, WAITING_ROOM_CHANNEL_ID
-from database import log_message_to_db, load_excluded_channels
-from state import temp_bans, banned_users_roles
+from config import (
+    BANNED_WORDS,
+    INVITE_POOL_SIZE,
+    PIPELINE_MODERATION_WORKERS,
+    PIPELINE_QUEUE_SIZE,
+    SPAM_USER_BURST,
+    SPAM_USER_PER_SECOND,
+    SPAM_DUPLICATE_ACCOUNTS,
+    SPAM_DUPLICATE_MIN_LENGTH,
+    SPAM_DUPLICATE_WINDOW_SECONDS,
+    SPAM_CHANNEL_MESSAGES,
+    SPAM_CHANNEL_WINDOW_SECONDS,
+    SPAM_USER_ACTIONS,
+    SPAM_DUPLICATE_ACTIONS,
+    SPAM_CHANNEL_ACTIONS,
+    SPAM_TIMEOUT_SECONDS,
+    SPAM_SLOWMODE_SECONDS,
+    SPAM_SLOWMODE_DURATION_SECONDS,
+    STORED_ROLES_TTL_DAYS,
+    TEMP_BAN_UNBAN_CONCURRENCY,
+    WAITING_ROOM_SERVER_ID,
+    WAITING_ROOM_CHANNEL_ID,
+)
+from database import (
+    get_excluded_channels,
+    load_banned_word_rules,
+    save_banned_word_rule,
+    delete_banned_word_rule,
+    load_temp_bans,
+    save_temp_ban,
+    delete_temp_ban,
+    get_stored_roles,
+    save_stored_roles,
+    delete_stored_roles,
+    delete_expired_stored_roles,
+)
+from utils.actions import ActionExecutor, DM_BUCKET, channel_bucket, guild_bucket
+from utils.banned_words import (
+    ACTIONS,
+    BAN,
+    DELETE,
+    MATCH_MODES,
+    WHOLE_WORD,
+    BannedWordRule,
+    GuildMatcherCache,
+)
+from utils.checks import is_owner
+from utils.invites import InvitePool
+from utils.log_writer import MessageLogWriter
+from utils.normalize import normalize_text
+from utils.pipeline import BLOCK, DROP, Pipeline, Stage
+from utils.scheduler import ExpiryScheduler
+from utils.text_diff import checksum, encode_edit
+
+
+def build_log_entry(message, kind, created_at, content, extras):
+    """Shape a message into a message_logs row for MessageLogWriter."""
+    return {
+        "guild_id": message.guild.id if message.guild else None,
+        "guild_name": message.guild.name if message.guild else "Direct Message",
+        "channel_id": message.channel.id,
+        "channel_name": message.channel.name if message.guild else "Direct Message",
+        "user_id": message.author.id,
+        "user_name": message.author.name,
+        "message_id": message.id,
+        "created_at": created_at,
+        "kind": kind,
+        "content": content,
+        "extras": extras,
+    }
+
+
+# Spam detection. Every tracker is an LRU dict of small __slots__ records, so
+# each message costs O(1) and memory stays bounded however many users post.
+SPAM_TRACKED_USERS = 10000
+SPAM_TRACKED_CHANNELS = 2000
+SPAM_TRACKED_FINGERPRINTS = 5000
+# Only the start of a message is fingerprinted
+SPAM_FINGERPRINT_CHARS = 256
+# Links make even a short message worth fingerprinting
+_LINK = re.compile(r"https?://|www\.|discord\.gg/", re.IGNORECASE)
+
+SPAM_DELETE = "delete"
+SPAM_TIMEOUT = "timeout"
+SPAM_SLOWMODE = "slowmode"
+
+
+class LRUDict(OrderedDict):
+    """OrderedDict that forgets its least recently used key past ``max_size``."""
+
+    def __init__(self, max_size):
+        super().__init__()
+        self.max_size = max_size
+
+    def touch(self, key, factory):
+        """Return the record for ``key``, creating it with ``factory()`` if needed."""
+        record = self.get(key)
+        if record is None:
+            record = self[key] = factory()
+            if len(self) > self.max_size:
+                self.popitem(last=False)
+        else:
+            self.move_to_end(key)
+        return record
+
+
+class _UserBucket:
+    """Token bucket: a full bucket allows a burst, then a steady rate."""
+
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens, updated):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class _ChannelRing:
+    """Timestamps of a channel's last N messages, oldest at ``index``."""
+
+    __slots__ = ("times", "index", "quiet_until")
+
+    def __init__(self, size):
+        self.times = [float("-inf")] * size
+        self.index = 0
+        # Not flagged again until the first flood has been dealt with
+        self.quiet_until = float("-inf")
+
+
+class _Fingerprint:
+    """Accounts (and their messages) that recently posted the same text.
+
+    The first copies are only held here: punishing starts with the copy
+    that reaches SPAM_DUPLICATE_ACCOUNTS.
+    """
+
+    __slots__ = ("first_seen", "messages", "flagged")
+
+    def __init__(self, first_seen):
+        self.first_seen = first_seen
+        self.messages = {}
+        self.flagged = False
+
+
+class SpamVerdict:
+    __slots__ = ("reason", "actions", "messages")
+
+    def __init__(self, reason, actions, messages):
+        self.reason = reason
+        self.actions = actions
+        self.messages = messages
+
+
+class SpamDetector:
+    """Flag members who post too fast, text posted by several accounts at
+    once, and channels receiving more messages than a window allows."""
+
+    def __init__(self):
+        self.users = LRUDict(SPAM_TRACKED_USERS)
+        self.channels = LRUDict(SPAM_TRACKED_CHANNELS)
+        self.fingerprints = LRUDict(SPAM_TRACKED_FINGERPRINTS)
+
+    @staticmethod
+    def fingerprint(message):
+        """Hash of the message text folded like the banned word filter, so
+        case, spacing and lookalike letters don't tell copies apart.
 
+        None for messages not worth comparing: short plain text ("lol",
+        "gg", "+1") is posted by many members at once in any active channel,
+        so it only counts with a link, a mention or an attachment.
+        """
+        content = message.content
+        text = " ".join(normalize_text(content[:SPAM_FINGERPRINT_CHARS]).split())
+        if not text:
+            return None
+        if len(text) < SPAM_DUPLICATE_MIN_LENGTH and not (
+            message.attachments
+            or message.mentions
+            or message.role_mentions
+            or message.mention_everyone
+            or _LINK.search(content)
+        ):
+            return None
+        return hash(text)
+
+    def check(self, message):
+        """Return the SpamVerdicts ``message`` triggers (usually none)."""
+        now = message.created_at.timestamp()
+        verdicts = []
+
+        if SPAM_USER_ACTIONS:
+            bucket = self.users.touch(
+                (message.guild.id, message.author.id),
+                lambda: _UserBucket(SPAM_USER_BURST, now),
+            )
+            bucket.tokens = min(
+                SPAM_USER_BURST,
+                bucket.tokens + (now - bucket.updated) * SPAM_USER_PER_SECOND,
+            )
+            bucket.updated = now
+            if bucket.tokens >= 1:
+                bucket.tokens -= 1
+            else:
+                verdicts.append(
+                    SpamVerdict("Sending messages too fast", SPAM_USER_ACTIONS, [message])
+                )
 
-class Moderation(commands.Cog):
-    def __init__(self, bot):
-        self.bot = bot
+        if SPAM_DUPLICATE_ACTIONS and message.content:
+            key = self.fingerprint(message)
+            if key is not None:
+                record = self.fingerprints.touch(
+                    (message.guild.id, key), lambda: _Fingerprint(now)
+                )
+                if now - record.first_seen > SPAM_DUPLICATE_WINDOW_SECONDS:
+                    record.first_seen = now
+                    record.messages.clear()
+                    record.flagged = False
+                if record.flagged:
+                    verdicts.append(
+                        SpamVerdict(
+                            "Same message posted by several accounts",
+                            SPAM_DUPLICATE_ACTIONS,
+                            [message],
+                        )
+                    )
+                elif len(record.messages) < SPAM_DUPLICATE_ACCOUNTS:
+                    # At most SPAM_DUPLICATE_ACCOUNTS entries are ever kept
+                    record.messages.setdefault(message.author.id, message)
+                    if len(record.messages) >= SPAM_DUPLICATE_ACCOUNTS:
+                        record.flagged = True
+                        verdicts.append(
+                            SpamVerdict(
+                                "Same message posted by several accounts",
+                                SPAM_DUPLICATE_ACTIONS,
+                                [message],
+                            )
+                        )
 
-    def cog_load(self):
-        self.check_temp_bans.start()
+        if SPAM_CHANNEL_ACTIONS:
+            ring = self.channels.touch(
+                message.channel.id, lambda: _ChannelRing(SPAM_CHANNEL_MESSAGES)
+            )
+            oldest = ring.times[ring.index]
+            ring.times[ring.index] = now
+            ring.index = (ring.index + 1) % len(ring.times)
+            if now - oldest < SPAM_CHANNEL_WINDOW_SECONDS and now >= ring.quiet_until:
+                ring.quiet_until = now + SPAM_SLOWMODE_DURATION_SECONDS
+                verdicts.append(
+                    SpamVerdict("Channel flooded", SPAM_CHANNEL_ACTIONS, [message])
+                )
 
-    def cog_unload(self):
-        self.check_temp_bans.cancel()
+        return verdicts
 
-    async def ban_user(self, message, word):
-        try:
-            member = message.author
-            guild = message.guild
-            user_id = member.id
 
-            user_roles = [
-                role.id for role in member.roles if role.name != "@everyone"
-            ]
+def unban_invite_channel(guild):
+    """First text channel we can create an invite for after an unban."""
+    return next(
+        (
+            channel
+            for channel in guild.text_channels
+            if channel.permissions_for(guild.me).create_instant_invite
+        ),
+        None,
+    )
 
-            if user_id not in banned_users_roles:
-                banned_users_roles[user_id] = {}
-            banned_users_roles[user_id][guild.id] = user_roles
 
-            logging.info(f"Stored roles for {member.name} in {guild.name}: {user_roles}")
+def format_minutes(minutes):
+    return f"{minutes} minute" if minutes == 1 else f"{minutes} minutes"
 
-            temp_bans[user_id] = {
-                "guild_id": guild.id,
-                "guild": guild,
-                "expiry": utcnow() + timedelta(minutes=1),
-            }
 
-            await guild.ban(
-                member,
-                reason=f"Used banned word: {word}",
-                delete_message_seconds=0,
-            )
+def _choices(values, current):
+    return [
+        app_commands.Choice(name=value, value=value)
+        for value in values
+        if current.lower() in value.lower()
+    ]
 
-            waiting_room = self.bot.get_guild(WAITING_ROOM_SERVER_ID)
-            if not waiting_room:
-                logging.error("Waiting room server not found!")
-                return
 
-            try:
-                waiting_channel = waiting_room.get_channel(
-                    WAITING_ROOM_CHANNEL_ID
-                )
-                invite = await waiting_channel.create_invite(
-                    max_age=0, max_uses=1, unique=True
-                )
+async def banned_word_action_autocomplete(
+    interaction: discord.Interaction, current: str
+) -> typing.List[app_commands.Choice[str]]:
+    return _choices(["add", "remove", "list"], current)
 
-                await member.send(
-                    f"You have been temporarily suspended from {guild.name} for using the banned word: **{word}**\n"
-                    f"The suspension will last for 1 minute.\n\n"
-                    f"Please join our waiting room server to be notified when your suspension expires: {invite.url}\n\n"
-                    f"⚠️ Note: The following words are banned:\n"
-                    f"```\n{', '.join(BANNED_WORDS)}```"
-                )
 
-                await member.kick(reason=f"Used banned word: {word}")
-                await message.delete()
+async def banned_word_autocomplete(
+    interaction: discord.Interaction, current: str
+) -> typing.List[app_commands.Choice[str]]:
+    if interaction.namespace.action != "remove" or interaction.guild is None:
+        return []
+    cog = interaction.client.get_cog("Moderation")
+    words = [rule.word for rule in cog.banned_words.rules_for(interaction.guild.id)]
+    return _choices(sorted(words), current)[:25]
 
-                await message.channel.send(
-                    f"🚫 {member.mention} has been temporarily suspended for using the banned word: **{word}**\n"
-                    "They will be able to rejoin in 1 minute."
-                )
 
-            except discord.Forbidden:
-                await message.channel.send(
-                    "I don't have permission to perform this action.",
-                    delete_after=10,
+async def match_mode_autocomplete(
+    interaction: discord.Interaction, current: str
+) -> typing.List[app_commands.Choice[str]]:
+    return _choices(MATCH_MODES, current)
+
+
+async def punishment_autocomplete(
+    interaction: discord.Interaction, current: str
+) -> typing.List[app_commands.Choice[str]]:
+    return _choices(ACTIONS, current)
+
+
+class Moderation(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.log_writer = MessageLogWriter()
+        # Compiled matcher per guild; guilds without rules use BANNED_WORDS
+        self.banned_words = GuildMatcherCache(BANNED_WORDS)
+        # Pending unbans keyed by (user_id, guild_id), mirrored in temp_bans
+        self.unban_scheduler = ExpiryScheduler(
+            self.unban, TEMP_BAN_UNBAN_CONCURRENCY, name="temp-ban-scheduler"
+        )
+        self.actions = ActionExecutor()
+        self.invite_pool = InvitePool(self.actions, INVITE_POOL_SIZE)
+        self.spam_detector = SpamDetector()
+        # Slowmode we turned on: {channel_id: delay to restore}
+        self.slowmode_restore = {}
+        self.slowmode_scheduler = ExpiryScheduler(
+            self.end_slowmode, name="slowmode-scheduler"
+        )
+        # on_message only queues the message; a slow ban or database call
+        # holds up its own stage instead of the gateway
+        self.message_pipeline = Pipeline(
+            "message",
+            [
+                Stage("filter", self.filter_stage, 1, PIPELINE_QUEUE_SIZE, DROP),
+                Stage(
+                    "moderate",
+                    self.moderate_stage,
+                    PIPELINE_MODERATION_WORKERS,
+                    PIPELINE_QUEUE_SIZE,
+                    BLOCK,
+                ),
+                Stage("log", self.log_stage, 1, PIPELINE_QUEUE_SIZE, BLOCK),
+                Stage("dispatch", self.dispatch_stage, 2, PIPELINE_QUEUE_SIZE, BLOCK),
+            ],
+        )
+
+    async def cog_load(self):
+        try:
+            rows = await load_banned_word_rules()
+        except Exception as e:
+            logging.error(f"Failed to load banned word rules, using defaults: {e}")
+        else:
+            self.banned_words.load(
+                (
+                    row["guild_id"],
+                    BannedWordRule(
+                        row["word"], row["match_mode"], row["action"], row["ban_minutes"]
+                    ),
                 )
-            except Exception as e:
-                logging.error(f"Error in ban_user: {str(e)}")
-                await message.channel.send(
-                    "An error occurred while processing the suspension.",
-                    delete_after=10,
+                for row in rows
+            )
+        try:
+            for row in await load_temp_bans():
+                self.unban_scheduler.schedule(
+                    (row["user_id"], row["guild_id"]), row["expires_at"]
                 )
-
         except Exception as e:
-            logging.error(f"Error in ban_user: {str(e)}")
+            logging.error(f"Failed to load pending temporary bans: {e}")
+        # Unbans need the guild cache, so wait for the gateway; bans that
+        # expired while the bot was down are handled as soon as it is ready
+        self.unban_scheduler.start(before_start=self.prepare_invites)
+        self.log_writer.start()
+        self.message_pipeline.start()
+        self.slowmode_scheduler.start()
+        if STORED_ROLES_TTL_DAYS > 0:
+            self.cleanup_stored_roles.start()
+
+    async def cog_unload(self):
+        self.cleanup_stored_roles.cancel()
+        await self.message_pipeline.close()
+        logging.info(f"Message pipeline closed: {self.message_pipeline.stats()}")
+        await self.unban_scheduler.close()
+        await self.slowmode_scheduler.close()
+        for channel_id in list(self.slowmode_restore):
+            await self.end_slowmode(channel_id)
+        await self.invite_pool.close()
+        logging.info(
+            f"Moderation actions: {self.actions.stats()}, invites: {self.invite_pool.stats()}"
+        )
+        await self.log_writer.close()
+        logging.info(f"Message log writer closed: {self.log_writer.stats()}")
 
-    @tasks.loop(seconds=30)
-    async def check_temp_bans(self):
-        current_time = utcnow()
-        to_unban = []
+    async def punish(self, message, rule):
+        if rule.action == DELETE:
+            await self.delete_banned_message(message, rule.word)
+        else:
+            await self.ban_user(message, rule.word, rule.ban_minutes)
 
-        for user_id, ban_info in temp_bans.items():
-            if current_time >= ban_info["expiry"]:
-                to_unban.append((user_id, ban_info))
+    async def delete_banned_message(self, message, word):
+        try:
+            await self.actions.run(channel_bucket(message.channel), message.delete)
+            await self.actions.run(
+                channel_bucket(message.channel),
+                message.channel.send,
+                f"🚫 {message.author.mention}, your message was removed for using the banned word: **{word}**",
+                delete_after=10,
+            )
+        except discord.Forbidden:
+            logging.error(f"Missing permission to delete a message in {message.channel}")
+        except Exception as e:
+            logging.error(f"Error in delete_banned_message: {str(e)}")
+
+    async def ban_user(self, message, word, minutes=1):
+        """Delete the message and suspend its author.
+
+        The message is removed first; the channel notice, the role snapshot
+        and the DM-then-ban chain then run concurrently through the action
+        executor.
+        """
+        member = message.author
+        guild = message.guild
+        duration = format_minutes(minutes)
+        user_roles = [role.id for role in member.roles if role.name != "@everyone"]
+
+        async def remove_message():
+            await self.actions.run(channel_bucket(message.channel), message.delete)
+            await self.actions.run(
+                channel_bucket(message.channel),
+                message.channel.send,
+                f"🚫 {member.mention} has been temporarily suspended for using the banned word: **{word}**\n"
+                f"They will be able to rejoin in {duration}.",
+            )
+
+        async def store_roles():
+            try:
+                await save_stored_roles(member.id, guild.id, user_roles)
+            except Exception as e:
+                logging.error(f"Failed to save stored roles for {member.name}: {e}")
+            logging.info(f"Stored roles for {member.name} in {guild.name}: {user_roles}")
 
-        for user_id, ban_info in to_unban:
+        async def notify_and_ban():
+            # The DM has to go out while the member still shares a guild with us
             try:
-                guild = ban_info.get("guild") or self.bot.get_guild(
-                    ban_info["guild_id"]
+                text = (
+                    f"You have been temporarily suspended from {guild.name} for using the banned word: **{word}**\n"
+                    f"The suspension will last for {duration}.\n\n"
                 )
-                if not guild:
-                    logging.error(f"Could not find guild for user {user_id}")
-                    continue
+                waiting_channel = self.waiting_room_channel()
+                if waiting_channel is not None:
+                    invite = await self.invite_pool.take(waiting_channel)
+                    text += f"Please join our waiting room server to be notified when your suspension expires: {invite.url}\n\n"
+                else:
+                    logging.error("Waiting room server not found!")
+                text += (
+                    f"⚠️ Note: The following words are banned:\n"
+                    f"```\n{', '.join(rule.word for rule in self.banned_words.rules_for(guild.id))}```"
+                )
+                await self.actions.run(DM_BUCKET, member.send, text)
+            except discord.Forbidden:
+                logging.error(f"Could not send DM to user {member.id}")
+            except Exception as e:
+                logging.error(f"Error sending suspension notice: {str(e)}")
 
-                user = discord.Object(id=user_id)
+            await self.actions.run(
+                guild_bucket(guild),
+                guild.ban,
+                member,
+                reason=f"Used banned word: {word}",
+                delete_message_seconds=0,
+            )
 
-                try:
-                    await guild.unban(user, reason="Temporary ban expired")
-                    logging.info(
-                        f"Successfully unbanned user {user_id} from {guild.name}"
-                    )
+            expires_at = utcnow() + timedelta(minutes=minutes)
+            self.unban_scheduler.schedule((member.id, guild.id), expires_at)
+            # Have an invite ready by the time the ban expires
+            self.invite_pool.warm(unban_invite_channel(guild))
+            try:
+                await save_temp_ban(member.id, guild.id, expires_at)
+            except Exception as e:
+                # Still unban on time, it just won't survive a restart
+                logging.error(f"Failed to save temporary ban for {member.name}: {e}")
 
-                    invite_channel = next(
-                        (
-                            channel
-                            for channel in guild.text_channels
-                            if channel.permissions_for(
-                                guild.me
-                            ).create_instant_invite
-                        ),
-                        None,
+        results = await asyncio.gather(
+            remove_message(), store_roles(), notify_and_ban(), return_exceptions=True
+        )
+        if any(isinstance(result, discord.Forbidden) for result in results):
+            await message.channel.send(
+                "I don't have permission to perform this action.",
+                delete_after=10,
+            )
+        elif any(isinstance(result, Exception) for result in results):
+            for result in results:
+                if isinstance(result, Exception):
+                    logging.error(f"Error in ban_user: {str(result)}")
+            await message.channel.send(
+                "An error occurred while processing the suspension.",
+                delete_after=10,
+            )
+
+    async def punish_spam(self, verdicts):
+        # One call per action and target: a member can get several verdicts
+        # (too fast and duplicates), and the coroutine is only created once
+        calls = {}
+        for verdict in verdicts:
+            logging.info(
+                f"{verdict.reason} in #{verdict.messages[-1].channel}: "
+                f"{', '.join(sorted({m.author.name for m in verdict.messages}))}"
+            )
+            for target in verdict.messages:
+                key = ("delete", target.id)
+                if SPAM_DELETE in verdict.actions and key not in calls:
+                    calls[key] = self.actions.run(
+                        channel_bucket(target.channel), target.delete
+                    )
+                key = ("timeout", target.author.id)
+                if (
+                    SPAM_TIMEOUT in verdict.actions
+                    and isinstance(target.author, discord.Member)
+                    and key not in calls
+                ):
+                    calls[key] = self.actions.run(
+                        guild_bucket(target.guild),
+                        target.author.timeout,
+                        timedelta(seconds=SPAM_TIMEOUT_SECONDS),
+                        reason=verdict.reason,
                     )
+            channel = verdict.messages[-1].channel
+            key = ("slowmode", channel.id)
+            if SPAM_SLOWMODE in verdict.actions and key not in calls:
+                calls[key] = self.start_slowmode(channel)
+
+        results = await asyncio.gather(*calls.values(), return_exceptions=True)
+        for result in results:
+            # NotFound: someone else already deleted the message
+            if isinstance(result, Exception) and not isinstance(result, discord.NotFound):
+                logging.error(f"Error punishing spam: {str(result)}")
+
+    async def start_slowmode(self, channel):
+        if channel.slowmode_delay >= SPAM_SLOWMODE_SECONDS:
+            return
+        self.slowmode_restore.setdefault(channel.id, channel.slowmode_delay)
+        await self.actions.run(
+            channel_bucket(channel),
+            channel.edit,
+            slowmode_delay=SPAM_SLOWMODE_SECONDS,
+            reason="Channel flooded",
+        )
+        self.slowmode_scheduler.schedule(
+            channel.id, utcnow() + timedelta(seconds=SPAM_SLOWMODE_DURATION_SECONDS)
+        )
 
-                    if invite_channel:
-                        invite = await invite_channel.create_invite(
-                            max_age=0,
-                            max_uses=1,
-                            reason="Temporary ban expired",
-                        )
+    async def end_slowmode(self, channel_id):
+        delay = self.slowmode_restore.pop(channel_id, None)
+        channel = self.bot.get_channel(channel_id)
+        if delay is None or channel is None:
+            return
+        try:
+            await self.actions.run(
+                channel_bucket(channel),
+                channel.edit,
+                slowmode_delay=delay,
+                reason="Flood is over",
+            )
+        except Exception as e:
+            logging.error(f"Failed to restore slowmode in #{channel}: {e}")
+
+    def waiting_room_channel(self):
+        waiting_room = self.bot.get_guild(WAITING_ROOM_SERVER_ID)
+        if not waiting_room:
+            return None
+        return waiting_room.get_channel(WAITING_ROOM_CHANNEL_ID)
+
+    async def unban(self, key):
+        """Lift an expired temporary ban (ExpiryScheduler callback)."""
+        user_id, guild_id = key
+        guild = self.bot.get_guild(guild_id)
+        if not guild:
+            # Left in the table, so it is retried on the next start
+            logging.error(f"Could not find guild {guild_id} to unban user {user_id}")
+            return
 
-                        try:
-                            user_obj = await self.bot.fetch_user(user_id)
-                            await user_obj.send(
-                                f"Your temporary ban from {guild.name} has expired! "
-                                f"You can rejoin using this invite: {invite.url}\n"
-                                "This invite will never expire."
-                            )
-                        except discord.Forbidden:
-                            logging.error(
-                                f"Could not send DM to user {user_id}"
-                            )
-                        except Exception as e:
-                            logging.error(
-                                f"Error sending unban notification: {str(e)}"
-                            )
+        user = discord.Object(id=user_id)
+
+        try:
+            await self.actions.run(
+                guild_bucket(guild), guild.unban, user, reason="Temporary ban expired"
+            )
+            logging.info(f"Successfully unbanned user {user_id} from {guild.name}")
 
-                except discord.NotFound:
-                    logging.error(
-                        f"User {user_id} was not found or already unbanned from {guild.name}"
+            invite_channel = unban_invite_channel(guild)
+            if invite_channel:
+                invite = await self.invite_pool.take(
+                    invite_channel, reason="Temporary ban expired"
+                )
+
+                try:
+                    user_obj = await self.bot.fetch_user(user_id)
+                    await self.actions.run(
+                        DM_BUCKET,
+                        user_obj.send,
+                        f"Your temporary ban from {guild.name} has expired! "
+                        f"You can rejoin using this invite: {invite.url}\n"
+                        "This invite will never expire.",
                     )
                 except discord.Forbidden:
-                    logging.error(
-                        f"Bot lacks permission to unban user {user_id} from {guild.name}"
-                    )
+                    logging.error(f"Could not send DM to user {user_id}")
                 except Exception as e:
-                    logging.error(
-                        f"Error unbanning user {user_id} from {guild.name}: {str(e)}"
-                    )
+                    logging.error(f"Error sending unban notification: {str(e)}")
+
+        except discord.NotFound:
+            logging.error(
+                f"User {user_id} was not found or already unbanned from {guild.name}"
+            )
+        except discord.Forbidden:
+            logging.error(
+                f"Bot lacks permission to unban user {user_id} from {guild.name}"
+            )
+        except Exception as e:
+            logging.error(
+                f"Error unbanning user {user_id} from {guild.name}: {str(e)}"
+            )
 
-                del temp_bans[user_id]
+        await delete_temp_ban(user_id, guild_id)
 
-            except Exception as e:
-                logging.error(
-                    f"Error processing unban for user {user_id}: {str(e)}"
-                )
+    async def prepare_invites(self):
+        """Fill the invite pools once the guild cache is available."""
+        await self.bot.wait_until_ready()
+        self.invite_pool.warm(self.waiting_room_channel())
+        for user_id, guild_id in self.unban_scheduler.keys():
+            guild = self.bot.get_guild(guild_id)
+            if guild:
+                self.invite_pool.warm(unban_invite_channel(guild))
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
-        if message.author.bot:
-            return
-
-        message_words = message.content.lower().split()
-        for word in message_words:
-            if word in [banned.lower() for banned in BANNED_WORDS]:
-                await self.ban_user(message, word)
-                return
-
-        await self.bot.process_commands(message)
+        # Everything else happens in the pipeline, off the gateway handler
+        self.message_pipeline.submit(message)
 
-        excluded_channels = load_excluded_channels()
-        if message.author == self.bot.user or message.channel.id in excluded_channels:
-            return
+    async def filter_stage(self, message):
+        if message.author.bot:
+            return None
+        return message
+
+    async def moderate_stage(self, message):
+        if message.guild is not None:
+            rule = self.banned_words.find(message.guild.id, message.content)
+            if rule is not None:
+                await self.punish(message, rule)
+                return None
+
+            # Members who can manage messages are trusted not to spam
+            if isinstance(message.author, discord.Member) and not (
+                message.author.guild_permissions.manage_messages
+            ):
+                verdicts = self.spam_detector.check(message)
+                if verdicts:
+                    await self.punish_spam(verdicts)
+                    if any(SPAM_DELETE in verdict.actions for verdict in verdicts):
+                        return None
+        return message
+
+    async def log_stage(self, message):
+        if message.channel.id not in get_excluded_channels():
+            extras = {}
+            if message.attachments:
+                extras["attachments"] = [
+                    attachment.url for attachment in message.attachments
+                ]
+            self.log_writer.submit(
+                build_log_entry(
+                    message, "message", message.created_at, message.content, extras
+                )
+            )
+        return message
 
-        message_data = {
-            "user": message.author.name,
-            "message": message.content,
-            "time": message.created_at.strftime("%Y-%m-%d %H:%M:%S"),
-            "attachments": (
-                [attachment.url for attachment in message.attachments]
-                if message.attachments
-                else "No attachments"
-            ),
-            "guild": message.guild.name if message.guild else "Direct Message",
-            "channel": message.channel.name if message.guild else "Direct Message",
-        }
-
-        log_message_to_db(message_data)
+    async def dispatch_stage(self, message):
         await self.bot.process_commands(message)
+        return None
 
     @commands.Cog.listener()
     async def on_message_edit(self, before, after):
-        excluded_channels = load_excluded_channels()
-        if before.author == self.bot.user or before.channel.id in excluded_channels:
+        # Like filter_stage: bot messages are not logged, so there would be
+        # no version for an edit diff to apply to
+        if before.author.bot or before.channel.id in get_excluded_channels():
+            return
+        # Embed updates (link previews) fire edit events too
+        if before.content == after.content:
             return
 
-        edit_data = {
-            "user": before.author.name,
-            "old_message": before.content,
-            "new_message": after.content,
-            "time": (
-                after.edited_at.strftime("%Y-%m-%d %H:%M:%S")
-                if after.edited_at
-                else before.created_at.strftime("%Y-%m-%d %H:%M:%S")
-            ),
-            "guild": before.guild.name if before.guild else "Direct Message",
-            "channel": before.channel.name if before.guild else "Direct Message",
-        }
-
-        log_message_to_db(edit_data)
+        # Stored as a diff against the previous version when that is smaller;
+        # the checksum lets utils.text_diff.rebuild_versions notice when that
+        # version is not the one it rebuilt (a log row was lost)
+        diff = encode_edit(before.content, after.content)
+        if diff is None:
+            content, extras = after.content, {}
+        else:
+            content, extras = None, {"diff": diff, "base": checksum(before.content)}
+
+        self.log_writer.submit(
+            build_log_entry(
+                after, "edit", after.edited_at or before.created_at, content, extras
+            )
+        )
         await self.bot.process_commands(after)
 
     @commands.Cog.listener()
@@ -239,12 +720,9 @@ class Moderation(commands.Cog):
             f"Member joined: {member.name} (ID: {user_id}) in guild {member.guild.name} (ID: {guild_id})"
         )
 
-        if (
-            user_id in banned_users_roles
-            and guild_id in banned_users_roles[user_id]
-        ):
+        stored_role_ids = get_stored_roles(user_id, guild_id)
+        if stored_role_ids is not None:
             try:
-                stored_role_ids = banned_users_roles[user_id][guild_id]
                 roles_to_add = []
                 for role_id in stored_role_ids:
                     role = member.guild.get_role(role_id)
@@ -261,9 +739,7 @@ class Moderation(commands.Cog):
                         f"Successfully restored roles for {member.name}: {role_names}"
                     )
 
-                del banned_users_roles[user_id][guild_id]
-                if not banned_users_roles[user_id]:
-                    del banned_users_roles[user_id]
+                await delete_stored_roles(user_id, guild_id)
 
             except discord.Forbidden as e:
                 logging.error(
@@ -274,6 +750,150 @@ class Moderation(commands.Cog):
                     f"Error restoring roles for {member.name}: {str(e)}"
                 )
 
+    @tasks.loop(hours=24)
+    async def cleanup_stored_roles(self):
+        try:
+            deleted = await delete_expired_stored_roles(STORED_ROLES_TTL_DAYS)
+        except Exception as e:
+            logging.error(f"Failed to clean up stored roles: {e}")
+            return
+        if deleted:
+            logging.info(
+                f"Dropped {deleted} stored role snapshots older than {STORED_ROLES_TTL_DAYS} days"
+            )
+
+    @app_commands.command(
+        name="manage_banned_words",
+        description="Manage the banned words of this server",
+    )
+    @app_commands.describe(
+        action="Add, remove or list the banned words",
+        word="The word to add or remove",
+        match_mode="word: only the word on its own, substring: also inside other words",
+        punishment="ban: temporary ban, delete: only delete the message",
+        ban_minutes="How long the temporary ban lasts",
+    )
+    @app_commands.autocomplete(action=banned_word_action_autocomplete)
+    @app_commands.autocomplete(word=banned_word_autocomplete)
+    @app_commands.autocomplete(match_mode=match_mode_autocomplete)
+    @app_commands.autocomplete(punishment=punishment_autocomplete)
+    @is_owner()
+    async def manage_banned_words_slash(
+        self,
+        interaction: discord.Interaction,
+        action: str,
+        word: str = None,
+        match_mode: str = WHOLE_WORD,
+        punishment: str = BAN,
+        ban_minutes: app_commands.Range[int, 1, 40320] = 1,
+        hide_message: bool = True,
+    ):
+        if interaction.guild is None:
+            await interaction.response.send_message(
+                "This command can only be used in a server.", ephemeral=True
+            )
+            return
+
+        guild_id = interaction.guild.id
+        word = word.strip() if word else None
+
+        if action == "add":
+            if not word or not normalize_text(word).strip():
+                await interaction.response.send_message(
+                    "Please specify a word to add.", ephemeral=True
+                )
+                return
+            if match_mode not in MATCH_MODES or punishment not in ACTIONS:
+                await interaction.response.send_message(
+                    f"Match mode must be one of {', '.join(MATCH_MODES)} "
+                    f"and punishment one of {', '.join(ACTIONS)}.",
+                    ephemeral=True,
+                )
+                return
+            other = self.banned_words.conflicting_word(guild_id, word)
+            if other is not None:
+                await interaction.response.send_message(
+                    f"**{word}** is the same banned word as **{other}** once accents "
+                    f"and look-alike letters are ignored. Remove **{other}** first "
+                    f"to change its rule.",
+                    ephemeral=True,
+                )
+                return
+
+            rules = [BannedWordRule(word, match_mode, punishment, ban_minutes)]
+            if not self.banned_words.has_own_rules(guild_id):
+                # The server's list starts from the default words, so adding
+                # one word does not silently drop all the others
+                rules = [
+                    rule for rule in self.banned_words.rules_for(guild_id)
+                    if rule.word != word
+                ] + rules
+            for rule in rules:
+                await save_banned_word_rule(guild_id, *rule)
+                self.banned_words.set_rule(guild_id, rule)
+
+            details = f"{match_mode}, {punishment}"
+            if punishment == BAN:
+                details += f" for {format_minutes(ban_minutes)}"
+            await interaction.response.send_message(
+                f"Banned word **{word}** saved ({details}).",
+                ephemeral=hide_message,
+            )
+
+        elif action == "remove":
+            if not word:
+                await interaction.response.send_message(
+                    "Please specify a word to remove.", ephemeral=True
+                )
+                return
+
+            if not self.banned_words.has_own_rules(guild_id):
+                # Removing a default word gives the server its own list
+                # holding the other defaults
+                defaults = self.banned_words.rules_for(guild_id)
+                remaining = [rule for rule in defaults if rule.word != word]
+                if remaining and len(remaining) < len(defaults):
+                    for rule in remaining:
+                        await save_banned_word_rule(guild_id, *rule)
+                        self.banned_words.set_rule(guild_id, rule)
+                    await interaction.response.send_message(
+                        f"Removed **{word}** from the banned words.",
+                        ephemeral=hide_message,
+                    )
+                    return
+
+            if await delete_banned_word_rule(guild_id, word):
+                self.banned_words.remove_rule(guild_id, word)
+                message = f"Removed **{word}** from the banned words."
+                if not self.banned_words.has_own_rules(guild_id):
+                    message += " The server now uses the default list."
+            else:
+                message = f"**{word}** is not a banned word of this server."
+            await interaction.response.send_message(message, ephemeral=hide_message)
+
+        elif action == "list":
+            lines = []
+            for rule in sorted(self.banned_words.rules_for(guild_id)):
+                line = f"{rule.word} ({rule.match_mode}, {rule.action}"
+                if rule.action == BAN:
+                    line += f" {format_minutes(rule.ban_minutes)}"
+                lines.append(line + ")")
+            source = (
+                "" if self.banned_words.has_own_rules(guild_id) else " (default list)"
+            )
+            listing = "\n".join(lines)
+            if len(listing) > 1900:  # stay under Discord's 2000 character limit
+                listing = listing[:1900].rsplit("\n", 1)[0] + "\n..."
+            await interaction.response.send_message(
+                f"Banned words{source}:\n```\n{listing}```",
+                ephemeral=hide_message,
+            )
+
+        else:
+            await interaction.response.send_message(
+                "Invalid action. Use add, remove or list.", ephemeral=True
+            )
+
 
 async def setup(bot):
     await bot.add_cog(Moderation(bot))
@@ -27,6 +27,125 @@ def get_api_weather():
     return os.getenv("OPENWEATHERMAP_API_KEY")
 
 
+# Database connection pool
+DB_POOL_MIN_SIZE = int(os.getenv("POSTGRES_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("POSTGRES_POOL_MAX_SIZE", "10"))
+# Seconds to wait for a free connection before giving up
+DB_ACQUIRE_TIMEOUT = float(os.getenv("POSTGRES_ACQUIRE_TIMEOUT", "5"))
+# Seconds a single statement may run before it is cancelled
+DB_COMMAND_TIMEOUT = float(os.getenv("POSTGRES_COMMAND_TIMEOUT", "30"))
+# Idle connections older than this (seconds) are closed and re-opened
+DB_MAX_INACTIVE_LIFETIME = float(os.getenv("POSTGRES_MAX_INACTIVE_LIFETIME", "300"))
+
+# Message log batch writer
+# Rows written per COPY
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "500"))
+# Longest a logged message waits in memory before being flushed
+LOG_FLUSH_INTERVAL_MS = int(os.getenv("LOG_FLUSH_INTERVAL_MS", "1000"))
+# Pending rows kept in memory; new rows are dropped once this is full
+LOG_QUEUE_MAX_SIZE = int(os.getenv("LOG_QUEUE_MAX_SIZE", "20000"))
+
+# Message log retention
+# Logs older than this many days are dropped a month at a time (0 = keep forever)
+LOG_RETENTION_DAYS = int(os.getenv("LOG_RETENTION_DAYS", "0"))
+# Monthly partitions created ahead of the current month
+LOG_PARTITIONS_AHEAD = int(os.getenv("LOG_PARTITIONS_AHEAD", "2"))
+# Re-read excluded logging channels this often, to pick up edits made directly
+# in the database (0 = only on startup)
+EXCLUDED_CHANNELS_REFRESH_SECONDS = int(
+    os.getenv("EXCLUDED_CHANNELS_REFRESH_SECONDS", "300")
+)
+
+# Outgoing HTTP (image downloads, joke/cat/weather APIs)
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))
+HTTP_MAX_CONNECTIONS_PER_HOST = int(os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", "8"))
+# Whole request, including the download
+HTTP_TIMEOUT_SECONDS = float(os.getenv("HTTP_TIMEOUT_SECONDS", "15"))
+# Downloads are aborted past this size
+HTTP_MAX_DOWNLOAD_BYTES = int(os.getenv("HTTP_MAX_DOWNLOAD_BYTES", str(25 * 1024 * 1024)))
+
+# Image rendering (utils/render.py)
+# Worker processes for Pillow work
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "2"))
+# A single render job is stopped after this many seconds
+RENDER_TIMEOUT_SECONDS = float(os.getenv("RENDER_TIMEOUT_SECONDS", "30"))
+
+# Input budget for rendering (utils/imaging.py)
+# Larger images are refused (JPEGs are measured after reduced-size decoding)
+IMAGE_MAX_INPUT_PIXELS = int(os.getenv("IMAGE_MAX_INPUT_PIXELS", "50000000"))
+# Still images are shrunk to fit this many pixels on their long side
+IMAGE_MAX_OUTPUT_SIZE = int(os.getenv("IMAGE_MAX_OUTPUT_SIZE", "2048"))
+# GIFs needing more decoding than this (frames x canvas pixels) are refused
+GIF_MAX_INPUT_PIXELS = int(os.getenv("GIF_MAX_INPUT_PIXELS", "500000000"))
+# GIF frames are shrunk to fit this many pixels on their long side
+GIF_MAX_OUTPUT_SIZE = int(os.getenv("GIF_MAX_OUTPUT_SIZE", "640"))
+# Longer GIFs keep every n-th frame (the timing is kept)
+GIF_MAX_FRAMES = int(os.getenv("GIF_MAX_FRAMES", "300"))
+# Formats tried for text on GIFs, the smallest output is sent: webp, apng,
+# gif. GIF is also the fallback when the others fail. APNG is only tried for
+# short animations: its encoder keeps every frame in memory
+ANIMATION_FORMATS = tuple(
+    fmt.strip().upper()
+    for fmt in os.getenv("ANIMATION_FORMATS", "webp,gif").split(",")
+    if fmt.strip()
+)
+
+# Render cache for the text overlay menus (utils/render_cache.py)
+# Rendered images kept in memory
+RENDER_CACHE_MEMORY_BYTES = int(os.getenv("RENDER_CACHE_MEMORY_BYTES", str(64 * 1024 * 1024)))
+# Rendered images kept on disk (0 disables the disk tier)
+RENDER_CACHE_DISK_BYTES = int(os.getenv("RENDER_CACHE_DISK_BYTES", str(512 * 1024 * 1024)))
+RENDER_CACHE_DIR = os.getenv(
+    "RENDER_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "render_cache"),
+)
+
+# Message pipeline (Moderation.on_message)
+# Messages waiting between two stages; the gateway drops new ones when the
+# first stage is full
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "1000"))
+# Messages checked for banned words (and punished) at the same time
+PIPELINE_MODERATION_WORKERS = int(os.getenv("PIPELINE_MODERATION_WORKERS", "4"))
+
+
+# Spam detection
+def _actions(name, default):
+    return tuple(
+        action.strip() for action in os.getenv(name, default).split(",") if action.strip()
+    )
+
+
+# One member: a burst of SPAM_USER_BURST messages, then SPAM_USER_PER_SECOND
+SPAM_USER_BURST = int(os.getenv("SPAM_USER_BURST", "5"))
+SPAM_USER_PER_SECOND = float(os.getenv("SPAM_USER_PER_SECOND", "0.5"))
+# The same text from this many accounts within the window is a raid
+SPAM_DUPLICATE_ACCOUNTS = int(os.getenv("SPAM_DUPLICATE_ACCOUNTS", "3"))
+SPAM_DUPLICATE_WINDOW_SECONDS = float(os.getenv("SPAM_DUPLICATE_WINDOW_SECONDS", "30"))
+# Shorter texts ("lol", "gg") only count with a link, mention or attachment
+SPAM_DUPLICATE_MIN_LENGTH = int(os.getenv("SPAM_DUPLICATE_MIN_LENGTH", "20"))
+# A channel receiving this many messages within the window is flooded
+SPAM_CHANNEL_MESSAGES = int(os.getenv("SPAM_CHANNEL_MESSAGES", "20"))
+SPAM_CHANNEL_WINDOW_SECONDS = float(os.getenv("SPAM_CHANNEL_WINDOW_SECONDS", "10"))
+# What to do in each case: any of delete, timeout, slowmode (empty = ignore)
+SPAM_USER_ACTIONS = _actions("SPAM_USER_ACTIONS", "delete,timeout")
+SPAM_DUPLICATE_ACTIONS = _actions("SPAM_DUPLICATE_ACTIONS", "delete,timeout")
+SPAM_CHANNEL_ACTIONS = _actions("SPAM_CHANNEL_ACTIONS", "slowmode")
+SPAM_TIMEOUT_SECONDS = int(os.getenv("SPAM_TIMEOUT_SECONDS", "300"))
+SPAM_SLOWMODE_SECONDS = int(os.getenv("SPAM_SLOWMODE_SECONDS", "10"))
+# How long slowmode stays on before the previous setting is restored
+SPAM_SLOWMODE_DURATION_SECONDS = int(os.getenv("SPAM_SLOWMODE_DURATION_SECONDS", "300"))
+
+# Temporary bans
+# Unbans processed at the same time, e.g. when catching up after downtime
+TEMP_BAN_UNBAN_CONCURRENCY = int(os.getenv("TEMP_BAN_UNBAN_CONCURRENCY", "5"))
+# Unused single-use invites kept ready per channel (waiting room, unban
+# invites), so bans and unbans don't wait for create_invite
+INVITE_POOL_SIZE = int(os.getenv("INVITE_POOL_SIZE", "2"))
+# Role snapshots of banned members who never rejoin are dropped after this
+# many days (0 = keep forever)
+STORED_ROLES_TTL_DAYS = int(os.getenv("STORED_ROLES_TTL_DAYS", "30"))
+
+
 # Constants
 CITY = [
     "New York",
@@ -1,143 +1,876 @@
-"""Database connection and operations for the Discord bot."""
+"""Database connection pool and operations for the Discord bot."""
 
+import asyncio
 import json
 import logging
 import os
-from datetime import datetime
+import re
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
 
-import psycopg2
+import asyncpg
 
+from config import (
+    DB_POOL_MIN_SIZE,
+    DB_POOL_MAX_SIZE,
+    DB_ACQUIRE_TIMEOUT,
+    DB_COMMAND_TIMEOUT,
+    DB_MAX_INACTIVE_LIFETIME,
+    LOG_PARTITIONS_AHEAD,
+    LOG_RETENTION_DAYS,
+)
 
-def get_db_connection():
-    conn = psycopg2.connect(
-        dbname=os.getenv("POSTGRES_DB"),
-        user=os.getenv("POSTGRES_USER"),
-        password=os.getenv("POSTGRES_PASSWORD"),
-        host=os.getenv("POSTGRES_HOST"),
-        port=os.getenv("POSTGRES_PORT"),
+_pool = None
+
+# Planner statistics are only refreshed by (auto)analyze, so there is no
+# point asking for them more often than this
+LOG_COUNT_CACHE_SECONDS = 60
+_log_count_cache = {"value": 0, "expires": 0.0}
+
+# Channels excluded from logging, mirrored in memory so that message events
+# never have to query the database. Replaced wholesale, never mutated.
+_excluded_channels = frozenset()
+
+# Role snapshots of temporarily banned members, restored when they rejoin.
+# Write-through mirror of stored_roles: {(user_id, guild_id): (role_ids, stored_at)}
+_stored_roles = {}
+
+
+# Columns written by log_messages_to_db, in COPY order
+MESSAGE_LOG_COLUMNS = (
+    "guild_id",
+    "guild_name",
+    "channel_id",
+    "channel_name",
+    "user_id",
+    "user_name",
+    "message_id",
+    "created_at",
+    "kind",
+    "content",
+    "extras",
+)
+
+
+def _encode_jsonb(value):
+    # Binary jsonb is a version byte followed by the JSON text
+    return b"\x01" + json.dumps(value).encode()
+
+
+def _decode_jsonb(data):
+    return json.loads(data[1:])
+
+
+async def _init_connection(conn):
+    # Exchange JSONB as Python objects. The codec has to be binary so that
+    # COPY (which only speaks the binary format) can still write it.
+    await conn.set_type_codec(
+        "jsonb",
+        encoder=_encode_jsonb,
+        decoder=_decode_jsonb,
+        schema="pg_catalog",
+        format="binary",
     )
-    return conn
 
 
-def initialize_database():
-    conn = get_db_connection()
-    cur = conn.cursor()
+async def init_pool():
+    """Create the shared connection pool (idempotent)."""
+    global _pool
+    if _pool is None:
+        _pool = await asyncpg.create_pool(
+            database=os.getenv("POSTGRES_DB"),
+            user=os.getenv("POSTGRES_USER"),
+            password=os.getenv("POSTGRES_PASSWORD"),
+            host=os.getenv("POSTGRES_HOST"),
+            port=int(os.getenv("POSTGRES_PORT", "5432")),
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=DB_POOL_MAX_SIZE,
+            command_timeout=DB_COMMAND_TIMEOUT,
+            max_inactive_connection_lifetime=DB_MAX_INACTIVE_LIFETIME,
+            init=_init_connection,
+        )
+        logging.info(
+            f"Database pool ready (min={DB_POOL_MIN_SIZE}, max={DB_POOL_MAX_SIZE})"
+        )
+    return _pool
 
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS logging_channels (
-            id SERIAL PRIMARY KEY,
-            channel_id BIGINT NOT NULL UNIQUE
-        );
-        """
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+def get_pool():
+    if _pool is None:
+        raise RuntimeError("Database pool is not initialized, call init_pool() first")
+    return _pool
+
+
+@asynccontextmanager
+async def acquire():
+    """Borrow a pooled connection, failing after DB_ACQUIRE_TIMEOUT seconds."""
+    async with get_pool().acquire(timeout=DB_ACQUIRE_TIMEOUT) as conn:
+        yield conn
+
+
+async def health_check():
+    """Round-trip a trivial query; returns latency in ms, or None if unhealthy."""
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    try:
+        async with acquire() as conn:
+            await conn.fetchval("SELECT 1")
+    except (asyncpg.PostgresError, OSError, asyncio.TimeoutError, RuntimeError) as e:
+        logging.error(f"Database health check failed: {e}")
+        return None
+    return (loop.time() - start) * 1000
+
+
+async def initialize_database():
+    async with acquire() as conn:
+        async with conn.transaction():
+            await conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS logging_channels (
+                    id SERIAL PRIMARY KEY,
+                    channel_id BIGINT NOT NULL UNIQUE
+                );
+
+                CREATE TABLE IF NOT EXISTS birthdays (
+                    id SERIAL PRIMARY KEY,
+                    username VARCHAR(255) NOT NULL UNIQUE,
+                    birthdate DATE NOT NULL
+                );
+
+                CREATE TABLE IF NOT EXISTS banned_word_rules (
+                    guild_id BIGINT NOT NULL,
+                    word TEXT NOT NULL,
+                    match_mode TEXT NOT NULL DEFAULT 'word',
+                    action TEXT NOT NULL DEFAULT 'ban',
+                    ban_minutes INTEGER NOT NULL DEFAULT 1,
+                    PRIMARY KEY (guild_id, word)
+                );
+
+                CREATE TABLE IF NOT EXISTS temp_bans (
+                    user_id BIGINT NOT NULL,
+                    guild_id BIGINT NOT NULL,
+                    expires_at TIMESTAMPTZ NOT NULL,
+                    PRIMARY KEY (user_id, guild_id)
+                );
+
+                CREATE TABLE IF NOT EXISTS stored_roles (
+                    user_id BIGINT NOT NULL,
+                    guild_id BIGINT NOT NULL,
+                    role_ids BIGINT[] NOT NULL,
+                    stored_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    PRIMARY KEY (user_id, guild_id)
+                );
+                """
+            )
+            await _create_message_logs(conn)
+        await create_upcoming_log_partitions(conn)
+
+
+async def _create_message_logs(conn):
+    is_legacy = await conn.fetchval(
+        "SELECT relkind = 'r' FROM pg_class WHERE oid = to_regclass('message_logs')"
     )
+    if is_legacy:
+        # A plain table from before partitioning: set it aside so that
+        # backfill_message_logs() can drain it into the partitioned table.
+        # Older versions lack the structured columns, add them so the
+        # drain query can read both layouts.
+        await conn.execute(
+            """
+            ALTER TABLE message_logs
+                ADD COLUMN IF NOT EXISTS guild_id BIGINT,
+                ADD COLUMN IF NOT EXISTS guild_name TEXT,
+                ADD COLUMN IF NOT EXISTS channel_id BIGINT,
+                ADD COLUMN IF NOT EXISTS channel_name TEXT,
+                ADD COLUMN IF NOT EXISTS user_id BIGINT,
+                ADD COLUMN IF NOT EXISTS user_name TEXT,
+                ADD COLUMN IF NOT EXISTS message_id BIGINT,
+                ADD COLUMN IF NOT EXISTS created_at TIMESTAMPTZ,
+                ADD COLUMN IF NOT EXISTS kind TEXT NOT NULL DEFAULT 'message',
+                ADD COLUMN IF NOT EXISTS content TEXT,
+                ADD COLUMN IF NOT EXISTS extras JSONB NOT NULL DEFAULT '{}';
 
-    cur.execute(
+            DROP INDEX IF EXISTS
+                message_logs_guild_created_idx,
+                message_logs_user_created_idx,
+                message_logs_created_id_idx;
+
+            ALTER TABLE message_logs RENAME CONSTRAINT message_logs_pkey
+                TO message_logs_legacy_pkey;
+            ALTER TABLE message_logs RENAME TO message_logs_legacy;
+            """
+        )
+        logging.info("Renamed unpartitioned message_logs to message_logs_legacy")
+
+    # The id sequence is shared with the legacy table so migrated rows keep
+    # their ids and new rows never collide with them
+    await conn.execute(
         """
+        CREATE SEQUENCE IF NOT EXISTS message_logs_id_seq AS BIGINT;
+        ALTER SEQUENCE message_logs_id_seq AS BIGINT;
+
         CREATE TABLE IF NOT EXISTS message_logs (
-            id SERIAL PRIMARY KEY,
-            encoded_message TEXT NOT NULL
-        );
+            id BIGINT NOT NULL DEFAULT nextval('message_logs_id_seq'),
+            guild_id BIGINT,
+            guild_name TEXT,
+            channel_id BIGINT,
+            channel_name TEXT,
+            user_id BIGINT,
+            user_name TEXT,
+            message_id BIGINT,
+            created_at TIMESTAMPTZ NOT NULL,
+            kind TEXT NOT NULL DEFAULT 'message',
+            content TEXT,
+            extras JSONB NOT NULL DEFAULT '{}',
+            PRIMARY KEY (created_at, id)
+        ) PARTITION BY RANGE (created_at);
+
+        ALTER SEQUENCE message_logs_id_seq OWNED BY message_logs.id;
+
+        CREATE INDEX IF NOT EXISTS message_logs_guild_created_idx
+            ON message_logs (guild_id, created_at);
+        CREATE INDEX IF NOT EXISTS message_logs_user_created_idx
+            ON message_logs (user_id, created_at);
+        CREATE INDEX IF NOT EXISTS message_logs_message_id_idx
+            ON message_logs (message_id);
+
+        -- Full-text search. 'simple' does no stemming, which suits the mix of
+        -- languages people write in.
+        ALTER TABLE message_logs ADD COLUMN IF NOT EXISTS search_vector TSVECTOR
+            GENERATED ALWAYS AS (to_tsvector('simple', COALESCE(content, ''))) STORED;
+        CREATE INDEX IF NOT EXISTS message_logs_search_idx
+            ON message_logs USING GIN (search_vector);
         """
     )
 
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS birthdays (
-            id SERIAL PRIMARY KEY,
-            username VARCHAR(255) NOT NULL UNIQUE,
-            birthdate DATE NOT NULL
-        );
-        """
+    # Trigram index for substring search. Creating the extension may need more
+    # privileges than the bot has; substring search still works without it,
+    # just without an index.
+    try:
+        async with conn.transaction():
+            await conn.execute(
+                """
+                CREATE EXTENSION IF NOT EXISTS pg_trgm;
+                CREATE INDEX IF NOT EXISTS message_logs_content_trgm_idx
+                    ON message_logs USING GIN (content gin_trgm_ops);
+                """
+            )
+    except asyncpg.PostgresError as e:
+        logging.warning(f"Trigram index unavailable, substring search will be slow: {e}")
+
+
+# Message log partitions: one per calendar month (UTC), named message_logs_YYYY_MM
+_PARTITION_NAME = re.compile(r"^message_logs_(\d{4})_(\d{2})$")
+
+
+def _month_start(moment):
+    return moment.astimezone(timezone.utc).replace(
+        day=1, hour=0, minute=0, second=0, microsecond=0
     )
 
-    conn.commit()
-    cur.close()
-    conn.close()
 
+def _next_month(month):
+    if month.month == 12:
+        return month.replace(year=month.year + 1, month=1)
+    return month.replace(month=month.month + 1)
 
-# Birthday operations
-def load_birthdays_from_db():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT username, birthdate FROM birthdays")
-    rows = cur.fetchall()
-    birthdays = {row[0]: row[1].strftime("%d-%m-%Y") for row in rows}
-    cur.close()
-    conn.close()
-    return birthdays
-
-
-def save_birthday_to_db(username, birthdate):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    try:
-        parsed_date = datetime.strptime(birthdate, "%d-%m-%Y").strftime("%Y-%m-%d")
-        cur.execute(
+
+async def _create_log_partitions(conn, months):
+    for month in sorted(months):
+        # DDL cannot take bind parameters; the bounds are formatted from
+        # datetimes we computed ourselves
+        await conn.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS message_logs_{month:%Y_%m}
+            PARTITION OF message_logs
+            FOR VALUES FROM ('{month.isoformat()}') TO ('{_next_month(month).isoformat()}')
             """
-            INSERT INTO birthdays (username, birthdate)
-            VALUES (%s, %s)
-            ON CONFLICT (username) DO UPDATE SET birthdate = EXCLUDED.birthdate
-            """,
-            (username, parsed_date),
         )
-        conn.commit()
+
+
+async def create_upcoming_log_partitions(conn=None, months_ahead=LOG_PARTITIONS_AHEAD):
+    """Make sure partitions exist for this month and the next few."""
+    month = _month_start(datetime.now(timezone.utc))
+    months = [month]
+    for _ in range(months_ahead):
+        month = _next_month(month)
+        months.append(month)
+
+    if conn is not None:
+        await _create_log_partitions(conn, months)
+        return
+    async with acquire() as conn:
+        await _create_log_partitions(conn, months)
+
+
+async def drop_log_partitions_before(cutoff):
+    """Drop every monthly partition that ends on or before ``cutoff``.
+
+    Returns the months dropped. Logs in the month containing ``cutoff`` are
+    kept: purging is done a whole partition at a time. The current and
+    upcoming partitions are never dropped, whatever the cutoff: new logs
+    would have nowhere to go.
+    """
+    cutoff = min(cutoff, _month_start(datetime.now(timezone.utc)))
+    dropped = []
+    async with acquire() as conn:
+        names = await conn.fetch(
+            """
+            SELECT c.relname
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'message_logs'::regclass
+            """
+        )
+        for row in names:
+            match = _PARTITION_NAME.match(row["relname"])
+            if not match:
+                continue
+            month = datetime(
+                int(match.group(1)), int(match.group(2)), 1, tzinfo=timezone.utc
+            )
+            if _next_month(month) <= cutoff:
+                await conn.execute(f"DROP TABLE IF EXISTS {row['relname']}")
+                dropped.append(month)
+
+    _log_count_cache["expires"] = 0.0
+    return sorted(dropped)
+
+
+async def drop_expired_log_partitions(retention_days=LOG_RETENTION_DAYS):
+    """Apply the retention window; a value of 0 keeps logs forever."""
+    if retention_days <= 0:
+        return []
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    dropped = await drop_log_partitions_before(cutoff)
+    if dropped:
+        logging.info(
+            "Dropped expired message log partitions: "
+            + ", ".join(f"{month:%Y-%m}" for month in dropped)
+        )
+    return dropped
+
+
+# created_at of a legacy row, falling back to the JSON blob it may still carry
+_LEGACY_CREATED_AT = r"""
+    COALESCE(
+        created_at,
+        CASE
+            WHEN encoded_message::jsonb->>'time' ~ '^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$'
+            THEN (encoded_message::jsonb->>'time')::timestamp AT TIME ZONE 'UTC'
+        END,
+        now()
+    )
+"""
+
+
+async def backfill_message_logs(batch_size=5000, pause=0.5):
+    """Drain message_logs_legacy into the partitioned message_logs table.
+
+    Rows are moved in small batches, each in its own transaction, so both
+    tables stay writable while the migration runs. The legacy table is
+    dropped once it is empty. Safe to run repeatedly.
+    """
+    async with acquire() as conn:
+        if not await conn.fetchval("SELECT to_regclass('message_logs_legacy') IS NOT NULL"):
+            return 0
+
+    total = 0
+    while True:
+        try:
+            moved = await _move_legacy_message_logs_batch(batch_size)
+        except asyncpg.PostgresError as e:
+            logging.error(f"Message log backfill stopped after {total} rows: {e}")
+            return total
+        if moved == 0:
+            break
+        total += moved
+        await asyncio.sleep(pause)
+
+    async with acquire() as conn:
+        await conn.execute("DROP TABLE IF EXISTS message_logs_legacy")
+    logging.info(f"Moved {total} legacy message logs into the partitioned table")
+    return total
+
+
+async def _move_legacy_message_logs_batch(batch_size):
+    async with acquire() as conn:
+        async with conn.transaction():
+            rows = await conn.fetch(
+                f"""
+                SELECT id, {_LEGACY_CREATED_AT} AS created_at
+                FROM message_logs_legacy
+                ORDER BY id
+                LIMIT $1
+                FOR UPDATE SKIP LOCKED
+                """,
+                batch_size,
+            )
+            if not rows:
+                return 0
+
+            await _create_log_partitions(
+                conn, {_month_start(row["created_at"]) for row in rows}
+            )
+            await conn.execute(
+                f"""
+                WITH moved AS (
+                    DELETE FROM message_logs_legacy
+                    WHERE id = ANY($1::bigint[])
+                    RETURNING *
+                ), parsed AS (
+                    SELECT moved.*,
+                           encoded_message::jsonb AS doc,
+                           {_LEGACY_CREATED_AT} AS moved_at
+                    FROM moved
+                )
+                INSERT INTO message_logs (
+                    id, guild_id, guild_name, channel_id, channel_name, user_id,
+                    user_name, message_id, created_at, kind, content, extras
+                )
+                SELECT
+                    id,
+                    guild_id,
+                    COALESCE(guild_name, doc->>'guild'),
+                    channel_id,
+                    COALESCE(channel_name, doc->>'channel'),
+                    user_id,
+                    COALESCE(user_name, doc->>'user'),
+                    message_id,
+                    moved_at,
+                    CASE
+                        WHEN doc IS NULL THEN kind
+                        WHEN doc ? 'old_message' THEN 'edit'
+                        ELSE 'message'
+                    END,
+                    CASE
+                        WHEN doc IS NULL THEN content
+                        ELSE COALESCE(doc->>'message', doc->>'new_message')
+                    END,
+                    CASE
+                        WHEN doc IS NULL THEN extras
+                        ELSE jsonb_strip_nulls(jsonb_build_object(
+                            'attachments', CASE
+                                WHEN jsonb_typeof(doc->'attachments') = 'array'
+                                THEN doc->'attachments'
+                            END,
+                            'old_message', doc->'old_message'
+                        ))
+                    END
+                FROM parsed
+                """,
+                [row["id"] for row in rows],
+            )
+    return len(rows)
+
+
+# Birthday operations
+async def load_birthdays_from_db():
+    async with acquire() as conn:
+        rows = await conn.fetch("SELECT username, birthdate FROM birthdays")
+    return {row["username"]: row["birthdate"].strftime("%d-%m-%Y") for row in rows}
+
+
+async def save_birthday_to_db(username, birthdate):
+    try:
+        parsed_date = datetime.strptime(birthdate, "%d-%m-%Y").date()
+        async with acquire() as conn:
+            await conn.execute(
+                """
+                INSERT INTO birthdays (username, birthdate)
+                VALUES ($1, $2)
+                ON CONFLICT (username) DO UPDATE SET birthdate = EXCLUDED.birthdate
+                """,
+                username,
+                parsed_date,
+            )
     except Exception as e:
         logging.error(f"Error saving birthday to DB: {e}")
-    finally:
-        cur.close()
-        conn.close()
 
 
-def delete_birthday_from_db(name):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM birthdays WHERE username = %s", (name,))
-    conn.commit()
-    cur.close()
-    conn.close()
+async def delete_birthday_from_db(name):
+    async with acquire() as conn:
+        await conn.execute("DELETE FROM birthdays WHERE username = $1", name)
 
 
 # Message logging operations
-def log_message_to_db(message_data):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT INTO message_logs (encoded_message) VALUES (%s)",
-        (json.dumps(message_data),),
-    )
-    conn.commit()
-    cur.close()
-    conn.close()
+async def log_message_to_db(message_data):
+    await log_messages_to_db([message_data])
 
 
-def load_excluded_channels():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT channel_id FROM logging_channels")
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
-    return [row[0] for row in rows]
+async def log_messages_to_db(messages):
+    """Write a batch of log entries (dicts keyed by MESSAGE_LOG_COLUMNS) with a single COPY."""
+    async with acquire() as conn:
+        await conn.copy_records_to_table(
+            "message_logs",
+            records=[
+                tuple(message_data.get(column) for column in MESSAGE_LOG_COLUMNS)
+                for message_data in messages
+            ],
+            columns=MESSAGE_LOG_COLUMNS,
+        )
+
+
+_LOG_PAGE_COLUMNS = (
+    "id, message_id, user_name, guild_name, channel_name, created_at, kind, content, extras"
+)
+
+
+async def fetch_message_log_page(before=None, after=None, at=None, offset=0, limit=25):
+    """Fetch one page of logs, newest first, by keyset on (created_at, id).
+
+    ``before``/``after`` are ``(created_at, id)`` cursors taken from the last
+    or first row of a page already shown; ``at`` starts the page at a point
+    in time. Without a cursor the page starts ``offset`` rows from the newest.
+    """
+    if after is not None:
+        query = f"""
+            SELECT {_LOG_PAGE_COLUMNS} FROM message_logs
+            WHERE (created_at, id) > ($1, $2)
+            ORDER BY created_at, id
+            LIMIT $3
+        """
+        args = (*after, limit)
+    elif before is not None:
+        query = f"""
+            SELECT {_LOG_PAGE_COLUMNS} FROM message_logs
+            WHERE (created_at, id) < ($1, $2)
+            ORDER BY created_at DESC, id DESC
+            LIMIT $3
+        """
+        args = (*before, limit)
+    elif at is not None:
+        query = f"""
+            SELECT {_LOG_PAGE_COLUMNS} FROM message_logs
+            WHERE created_at <= $1
+            ORDER BY created_at DESC, id DESC
+            LIMIT $2
+        """
+        args = (at, limit)
+    else:
+        query = f"""
+            SELECT {_LOG_PAGE_COLUMNS} FROM message_logs
+            ORDER BY created_at DESC, id DESC
+            OFFSET $1 LIMIT $2
+        """
+        args = (offset, limit)
+
+    async with acquire() as conn:
+        rows = await conn.fetch(query, *args)
+    if after is not None:
+        rows.reverse()
+    return rows
+
+
+async def fetch_message_history(message_id, since=None):
+    """All log rows of one message (the original and its edits), oldest first.
+
+    ``since`` (the message's creation time, which Discord encodes in its id)
+    lets the query skip the partitions from before the message existed.
+    """
+    conditions = ["message_id = $1"]
+    args = [message_id]
+    if since is not None:
+        conditions.append("created_at >= $2")
+        args.append(since)
+    async with acquire() as conn:
+        return await conn.fetch(
+            f"""
+            SELECT {_LOG_PAGE_COLUMNS} FROM message_logs
+            WHERE {" AND ".join(conditions)}
+            ORDER BY created_at, id
+            """,
+            *args,
+        )
+
+
+async def search_message_logs(
+    text,
+    substring=False,
+    user_id=None,
+    channel_id=None,
+    since=None,
+    until=None,
+    before=None,
+    after=None,
+    limit=25,
+):
+    """Fetch one page of logs matching ``text``, best match first.
+
+    Word search ranks matches of the tsvector index; substring search uses
+    ILIKE (trigram indexed) and orders by recency. Pages are keyset on
+    ``(rank, created_at, id)`` with ``before``/``after`` cursors as in
+    fetch_message_log_page().
+    """
+    args = []
+
+    def arg(value):
+        args.append(value)
+        return f"${len(args)}"
+
+    if substring:
+        escaped = (
+            text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        )
+        rank = "0::real"
+        conditions = [f"content ILIKE {arg(f'%{escaped}%')}"]
+    else:
+        tsquery = f"websearch_to_tsquery('simple', {arg(text)})"
+        rank = f"ts_rank_cd(search_vector, {tsquery})"
+        conditions = [f"search_vector @@ {tsquery}"]
+
+    if user_id is not None:
+        conditions.append(f"user_id = {arg(user_id)}")
+    if channel_id is not None:
+        conditions.append(f"channel_id = {arg(channel_id)}")
+    # Date bounds also let the planner skip whole partitions
+    if since is not None:
+        conditions.append(f"created_at >= {arg(since)}")
+    if until is not None:
+        conditions.append(f"created_at < {arg(until)}")
+
+    order = "DESC"
+    outer = ""
+    if after is not None:
+        order = "ASC"
+        outer = f"WHERE (rank, created_at, id) > ({arg(after[0])}, {arg(after[1])}, {arg(after[2])})"
+    elif before is not None:
+        outer = f"WHERE (rank, created_at, id) < ({arg(before[0])}, {arg(before[1])}, {arg(before[2])})"
+
+    query = f"""
+        SELECT * FROM (
+            SELECT {_LOG_PAGE_COLUMNS}, {rank} AS rank
+            FROM message_logs
+            WHERE {" AND ".join(conditions)}
+        ) AS matches
+        {outer}
+        ORDER BY rank {order}, created_at {order}, id {order}
+        LIMIT {arg(limit)}
+    """
+    async with acquire() as conn:
+        rows = await conn.fetch(query, *args)
+    if after is not None:
+        rows.reverse()
+    return rows
+
+
+async def estimate_message_log_count():
+    """Approximate row count from planner statistics, cached for a minute."""
+    now = time.monotonic()
+    if now < _log_count_cache["expires"]:
+        return _log_count_cache["value"]
+
+    # The partitioned parent has no statistics of its own, sum its partitions.
+    # reltuples is -1 (or 0 on older servers) until a table is first analyzed.
+    async with acquire() as conn:
+        estimate = await conn.fetchval(
+            """
+            SELECT COALESCE(SUM(GREATEST(c.reltuples, 0)), 0)::bigint
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'message_logs'::regclass
+            """
+        )
+    _log_count_cache["value"] = estimate
+    _log_count_cache["expires"] = now + LOG_COUNT_CACHE_SECONDS
+    return _log_count_cache["value"]
+
+
+async def delete_all_message_logs():
+    async with acquire() as conn:
+        async with conn.transaction():
+            # Rows still waiting for backfill_message_logs count as logs too,
+            # or they would be moved back in afterwards
+            if await conn.fetchval(
+                "SELECT to_regclass('message_logs_legacy') IS NOT NULL"
+            ):
+                await conn.execute("TRUNCATE message_logs, message_logs_legacy")
+            else:
+                await conn.execute("TRUNCATE message_logs")
+    _log_count_cache["expires"] = 0.0
+
+
+def get_excluded_channels():
+    """Cached set of channel ids excluded from logging (no database access)."""
+    return _excluded_channels
+
+
+async def load_excluded_channels():
+    """Reload the excluded channel cache from the database."""
+    global _excluded_channels
+    async with acquire() as conn:
+        rows = await conn.fetch("SELECT channel_id FROM logging_channels")
+    _excluded_channels = frozenset(row["channel_id"] for row in rows)
+    return _excluded_channels
 
 
 # Logging channels management (used by logging_cog)
-def add_logging_channel(channel_id):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT INTO logging_channels (channel_id) VALUES (%s) ON CONFLICT DO NOTHING",
-        (channel_id,),
-    )
-    conn.commit()
-    cur.close()
-    conn.close()
-
-
-def remove_logging_channel(channel_id):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM logging_channels WHERE channel_id = %s", (channel_id,))
-    conn.commit()
-    cur.close()
-    conn.close()
+async def add_logging_channel(channel_id):
+    global _excluded_channels
+    async with acquire() as conn:
+        await conn.execute(
+            "INSERT INTO logging_channels (channel_id) VALUES ($1) ON CONFLICT DO NOTHING",
+            channel_id,
+        )
+    _excluded_channels = _excluded_channels | {channel_id}
+
+
+async def remove_logging_channel(channel_id):
+    global _excluded_channels
+    async with acquire() as conn:
+        await conn.execute(
+            "DELETE FROM logging_channels WHERE channel_id = $1", channel_id
+        )
+    _excluded_channels = _excluded_channels - {channel_id}
+
+
+# Banned word rules (used by moderation)
+async def load_banned_word_rules():
+    async with acquire() as conn:
+        return await conn.fetch(
+            "SELECT guild_id, word, match_mode, action, ban_minutes FROM banned_word_rules"
+        )
+
+
+async def save_banned_word_rule(guild_id, word, match_mode, action, ban_minutes):
+    async with acquire() as conn:
+        await conn.execute(
+            """
+            INSERT INTO banned_word_rules (guild_id, word, match_mode, action, ban_minutes)
+            VALUES ($1, $2, $3, $4, $5)
+            ON CONFLICT (guild_id, word) DO UPDATE SET
+                match_mode = EXCLUDED.match_mode,
+                action = EXCLUDED.action,
+                ban_minutes = EXCLUDED.ban_minutes
+            """,
+            guild_id,
+            word,
+            match_mode,
+            action,
+            ban_minutes,
+        )
+
+
+async def delete_banned_word_rule(guild_id, word):
+    """Delete a rule. Returns False if the guild had no such rule."""
+    async with acquire() as conn:
+        status = await conn.execute(
+            "DELETE FROM banned_word_rules WHERE guild_id = $1 AND word = $2",
+            guild_id,
+            word,
+        )
+    return status != "DELETE 0"
+
+
+# Temporary bans (used by moderation)
+async def load_temp_bans():
+    async with acquire() as conn:
+        return await conn.fetch("SELECT user_id, guild_id, expires_at FROM temp_bans")
+
+
+async def save_temp_ban(user_id, guild_id, expires_at):
+    async with acquire() as conn:
+        await conn.execute(
+            """
+            INSERT INTO temp_bans (user_id, guild_id, expires_at)
+            VALUES ($1, $2, $3)
+            ON CONFLICT (user_id, guild_id) DO UPDATE SET expires_at = EXCLUDED.expires_at
+            """,
+            user_id,
+            guild_id,
+            expires_at,
+        )
+
+
+async def delete_temp_ban(user_id, guild_id):
+    async with acquire() as conn:
+        await conn.execute(
+            "DELETE FROM temp_bans WHERE user_id = $1 AND guild_id = $2",
+            user_id,
+            guild_id,
+        )
+
+
+# Stored roles of banned members (used by moderation and admin)
+def get_stored_roles(user_id, guild_id):
+    """Cached role ids stored for a member, or None (no database access)."""
+    entry = _stored_roles.get((user_id, guild_id))
+    return entry[0] if entry else None
+
+
+def get_stored_roles_for_user(user_id):
+    """Cached {guild_id: (role_ids, stored_at)} for a user (no database access)."""
+    return {
+        guild_id: entry
+        for (entry_user_id, guild_id), entry in _stored_roles.items()
+        if entry_user_id == user_id
+    }
+
+
+async def load_stored_roles():
+    """Reload the stored roles cache from the database."""
+    global _stored_roles
+    async with acquire() as conn:
+        rows = await conn.fetch(
+            "SELECT user_id, guild_id, role_ids, stored_at FROM stored_roles"
+        )
+    _stored_roles = {
+        (row["user_id"], row["guild_id"]): (row["role_ids"], row["stored_at"])
+        for row in rows
+    }
+    return len(_stored_roles)
+
+
+async def save_stored_roles(user_id, guild_id, role_ids):
+    # Cache first: if the write fails the roles are still restored, unless
+    # the bot restarts before the member rejoins
+    stored_at = datetime.now(timezone.utc)
+    _stored_roles[(user_id, guild_id)] = (list(role_ids), stored_at)
+    async with acquire() as conn:
+        await conn.execute(
+            """
+            INSERT INTO stored_roles (user_id, guild_id, role_ids, stored_at)
+            VALUES ($1, $2, $3, $4)
+            ON CONFLICT (user_id, guild_id) DO UPDATE SET
+                role_ids = EXCLUDED.role_ids,
+                stored_at = EXCLUDED.stored_at
+            """,
+            user_id,
+            guild_id,
+            role_ids,
+            stored_at,
+        )
+
+
+async def delete_stored_roles(user_id, guild_id):
+    _stored_roles.pop((user_id, guild_id), None)
+    async with acquire() as conn:
+        await conn.execute(
+            "DELETE FROM stored_roles WHERE user_id = $1 AND guild_id = $2",
+            user_id,
+            guild_id,
+        )
+
+
+async def delete_expired_stored_roles(max_age_days):
+    """Drop snapshots older than ``max_age_days`` that nobody came back for."""
+    async with acquire() as conn:
+        rows = await conn.fetch(
+            """
+            DELETE FROM stored_roles
+            WHERE stored_at < now() - make_interval(days => $1)
+            RETURNING user_id, guild_id
+            """,
+            max_age_days,
+        )
+    for row in rows:
+        _stored_roles.pop((row["user_id"], row["guild_id"]), None)
+    return len(rows)
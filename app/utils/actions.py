@@ -0,0 +1,97 @@
+"""Retrying executor for Discord API calls, grouped by rate-limit bucket."""
+
+import asyncio
+import logging
+
+import aiohttp
+import discord
+
+# Errors worth another try; anything else (Forbidden, NotFound...) is final
+_TRANSIENT = (aiohttp.ClientError, asyncio.TimeoutError, ConnectionError)
+
+
+def channel_bucket(channel):
+    """Messages in a channel share a rate limit (send, delete)."""
+    return ("channel", channel.id)
+
+
+def guild_bucket(guild):
+    """Member management in a guild shares a rate limit (ban, kick, unban)."""
+    return ("guild", guild.id)
+
+
+# Opening DM channels is limited per bot, not per guild or channel
+DM_BUCKET = ("dm",)
+
+
+class ActionExecutor:
+    """Run Discord API calls with bounded retries, at most
+    ``bucket_concurrency`` at a time per rate-limit bucket.
+
+    Calls in the same bucket hit the same Discord rate limit, so running them
+    side by side only earns a 429 and a sleep inside discord.py; calls in
+    different buckets run concurrently.
+    """
+
+    def __init__(self, attempts=3, base_delay=0.5, bucket_concurrency=1):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.bucket_concurrency = bucket_concurrency
+        # One semaphore per bucket; bounded by the channels and guilds we act in
+        self._buckets = {}
+
+        self.succeeded = 0
+        self.retried = 0
+        self.failed = 0
+
+    def _semaphore(self, bucket):
+        semaphore = self._buckets.get(bucket)
+        if semaphore is None:
+            semaphore = self._buckets[bucket] = asyncio.Semaphore(
+                self.bucket_concurrency
+            )
+        return semaphore
+
+    async def run(self, bucket, action, *args, **kwargs):
+        """Await ``action(*args, **kwargs)``, retrying transient failures.
+
+        Server errors, network errors and rate limits discord.py gave up on
+        are retried with exponential backoff; the last error is raised once
+        ``attempts`` is exhausted. Other errors are raised immediately.
+        """
+        semaphore = self._semaphore(bucket)
+        for attempt in range(1, self.attempts + 1):
+            delay = self.base_delay * 2 ** (attempt - 1)
+            try:
+                async with semaphore:
+                    result = await action(*args, **kwargs)
+            except discord.RateLimited as e:
+                error = e
+                delay = max(delay, e.retry_after)
+            except discord.HTTPException as e:
+                if e.status < 500:
+                    self.failed += 1
+                    raise
+                error = e
+            except _TRANSIENT as e:
+                error = e
+            else:
+                self.succeeded += 1
+                return result
+
+            if attempt == self.attempts:
+                self.failed += 1
+                raise error
+            self.retried += 1
+            logging.warning(
+                f"{getattr(action, '__qualname__', action)} failed ({error}), "
+                f"retrying in {delay:.1f}s ({attempt}/{self.attempts})"
+            )
+            await asyncio.sleep(delay)
+
+    def stats(self):
+        return {
+            "succeeded": self.succeeded,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
@@ -0,0 +1,208 @@
+"""Compiled multi-pattern matcher for banned words."""
+
+import logging
+import re
+from collections import namedtuple
+
+from utils.normalize import normalize_text, split_runs
+
+# Match modes
+WHOLE_WORD = "word"  # must stand on its own: "bi" does not match "bien"
+SUBSTRING = "substring"  # matches anywhere, including inside other words
+
+MATCH_MODES = (WHOLE_WORD, SUBSTRING)
+
+
+def _build_trie(words):
+    """Trie over the runs of each word (see split_runs)."""
+    trie = {}
+    for word in words:
+        node = trie
+        for run in word:
+            node = node.setdefault(run, {})
+        node[""] = None  # end of word
+    return trie
+
+
+def _trie_to_regex(node):
+    """Turn a trie into a regex whose alternatives never share a prefix.
+
+    The regex engine then reads each character of the message at most once
+    per starting position instead of once per banned word.
+    """
+    ends_here = "" in node
+    # Words are stored as runs of letters; "cc*" lets a run grow in the
+    # message, so "skiiibidi" still matches "skibidi" without rewriting it,
+    # while the run "ss" of "ass" needs at least two letters ("as" is fine).
+    # (Spelled "cc*" rather than "c+" so the engine keeps its fast scan for
+    # the first literal character.)
+    branches = []
+    for run, child in sorted(node.items()):
+        if run:
+            branches.append(f"{re.escape(run)}{re.escape(run[0])}*{_trie_to_regex(child)}")
+    if not branches:
+        return ""
+    if len(branches) == 1 and not ends_here:
+        return branches[0]
+    group = "(?:" + "|".join(branches) + ")"
+    # Optional groups are greedy, so the longest banned word is tried first
+    return group + "?" if ends_here else group
+
+
+class BannedWordMatcher:
+    """Find banned words in a message with a single compiled regex.
+
+    ``rules`` maps each banned word to WHOLE_WORD or SUBSTRING. The regex is
+    built once; each message is then normalized (see normalize_text) and
+    scanned in one pass regardless of how many words are banned. Repeated
+    letters are handled by the regex itself (see split_runs).
+    """
+
+    def __init__(self, rules):
+        # Letters of the word without repeats -> [(run lengths, word)]
+        self._words = {}
+        whole_words = []
+        substrings = []
+        for word, mode in rules.items():
+            runs = split_runs(self.prepare(word))
+            if not runs:
+                continue
+            self._words.setdefault(self._letters(runs), []).append(
+                (tuple(len(run) for run in runs), word)
+            )
+            if mode == SUBSTRING:
+                substrings.append(runs)
+            else:
+                whole_words.append(runs)
+
+        alternatives = []
+        if whole_words:
+            alternatives.append(rf"(?<!\w){_trie_to_regex(_build_trie(whole_words))}(?!\w)")
+        if substrings:
+            alternatives.append(_trie_to_regex(_build_trie(substrings)))
+        self._pattern = re.compile("|".join(alternatives)) if alternatives else None
+
+    @classmethod
+    def from_words(cls, words, mode=WHOLE_WORD):
+        return cls({word: mode for word in words})
+
+    @staticmethod
+    def prepare(text):
+        """Fold text the same way for banned words and for messages."""
+        return normalize_text(text)
+
+    @staticmethod
+    def _letters(runs):
+        return "".join(run[0] for run in runs)
+
+    def find(self, text):
+        """Return the first banned word in ``text`` (as it was given), or None."""
+        if self._pattern is None:
+            return None
+        match = self._pattern.search(self.prepare(text))
+        if match is None:
+            return None
+        runs = split_runs(match.group())
+        lengths = [len(run) for run in runs]
+        # Of the words the match can stand for ("god" and "good" both match
+        # "goood"), the one with the longest runs is the most specific
+        best = None
+        for word_lengths, word in self._words[self._letters(runs)]:
+            if all(need <= have for need, have in zip(word_lengths, lengths)):
+                if best is None or sum(word_lengths) > best[0]:
+                    best = sum(word_lengths), word
+        return best[1]
+
+    def __len__(self):
+        return sum(len(words) for words in self._words.values())
+
+
+# Punishments
+BAN = "ban"  # temporary ban for ban_minutes
+DELETE = "delete"  # only delete the message
+
+ACTIONS = (BAN, DELETE)
+
+BannedWordRule = namedtuple("BannedWordRule", "word match_mode action ban_minutes")
+
+
+class GuildMatcherCache:
+    """Compiled BannedWordMatcher per guild, built from its banned_word_rules.
+
+    Guilds without rules of their own use ``default_words``. Changing a rule
+    only recompiles the matcher of the guild it belongs to. Two words that
+    normalize the same ("immigre", "immigré") would match the same messages,
+    so a guild holds only one of them (see conflicting_word).
+    """
+
+    def __init__(self, default_words):
+        self._default_rules = {}
+        for word in default_words:
+            if self._conflict(self._default_rules, word) is None:
+                self._default_rules[word] = BannedWordRule(word, WHOLE_WORD, BAN, 1)
+        self._default_matcher = self._compile(self._default_rules)
+        self._rules = {}
+        self._matchers = {}
+
+    @staticmethod
+    def _compile(rules):
+        return BannedWordMatcher({rule.word: rule.match_mode for rule in rules.values()})
+
+    @staticmethod
+    def _conflict(rules, word):
+        key = BannedWordMatcher.prepare(word)
+        for other in rules:
+            if other != word and BannedWordMatcher.prepare(other) == key:
+                return other
+        return None
+
+    def load(self, rules):
+        """Replace every guild's rules, e.g. with the rows loaded at startup."""
+        self._rules = {}
+        for guild_id, rule in rules:
+            guild_rules = self._rules.setdefault(guild_id, {})
+            other = self._conflict(guild_rules, rule.word)
+            if other is not None:
+                logging.warning(
+                    f"Ignoring banned word {rule.word!r} of guild {guild_id}: "
+                    f"it is the same word as {other!r}"
+                )
+                continue
+            guild_rules[rule.word] = rule
+        self._matchers = {
+            guild_id: self._compile(guild_rules)
+            for guild_id, guild_rules in self._rules.items()
+        }
+
+    def conflicting_word(self, guild_id, word):
+        """Return the guild's other banned word that normalizes like ``word``, or None."""
+        return self._conflict(self._rules.get(guild_id, self._default_rules), word)
+
+    def set_rule(self, guild_id, rule):
+        self._rules.setdefault(guild_id, {})[rule.word] = rule
+        self._matchers[guild_id] = self._compile(self._rules[guild_id])
+
+    def remove_rule(self, guild_id, word):
+        guild_rules = self._rules.get(guild_id, {})
+        if guild_rules.pop(word, None) is None:
+            return False
+        if guild_rules:
+            self._matchers[guild_id] = self._compile(guild_rules)
+        else:
+            del self._rules[guild_id]
+            del self._matchers[guild_id]
+        return True
+
+    def has_own_rules(self, guild_id):
+        return guild_id in self._rules
+
+    def rules_for(self, guild_id):
+        return list(self._rules.get(guild_id, self._default_rules).values())
+
+    def find(self, guild_id, text):
+        """Return the BannedWordRule the message breaks, or None."""
+        matcher = self._matchers.get(guild_id, self._default_matcher)
+        word = matcher.find(text)
+        if word is None:
+            return None
+        return self._rules.get(guild_id, self._default_rules)[word]
@@ -0,0 +1,97 @@
+"""Shared, connection-pooled HTTP client for outgoing requests (images, APIs)."""
+
+import json
+
+import aiohttp
+
+from config import (
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_CONNECTIONS_PER_HOST,
+    HTTP_TIMEOUT_SECONDS,
+    HTTP_MAX_DOWNLOAD_BYTES,
+)
+
+_CHUNK_SIZE = 64 * 1024
+
+
+class DownloadTooLarge(ValueError):
+    """The response is bigger than the caller's byte limit."""
+
+
+class HttpClient:
+    """One aiohttp session for the whole bot, available as ``bot.http_client``.
+
+    Connections are kept alive and reused, limited in total and per host,
+    and DNS lookups are cached. Bodies are streamed and the download is
+    aborted as soon as it exceeds ``max_download_bytes``.
+    """
+
+    def __init__(
+        self,
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_connections_per_host=HTTP_MAX_CONNECTIONS_PER_HOST,
+        timeout=HTTP_TIMEOUT_SECONDS,
+        max_download_bytes=HTTP_MAX_DOWNLOAD_BYTES,
+    ):
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.timeout = timeout
+        self.max_download_bytes = max_download_bytes
+        self._session = None
+
+    async def start(self):
+        if self._session is None:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                limit_per_host=self.max_connections_per_host,
+                ttl_dns_cache=300,
+                keepalive_timeout=30,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(
+                    total=self.timeout, sock_connect=min(5, self.timeout)
+                ),
+            )
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def fetch(
+        self, url, params=None, headers=None, max_bytes=None, raise_for_status=True
+    ):
+        """GET ``url`` and return ``(body, content_type, status)``.
+
+        Raises DownloadTooLarge past ``max_bytes`` (default
+        ``max_download_bytes``), aiohttp.ClientResponseError on an error
+        status unless ``raise_for_status`` is False, and asyncio.TimeoutError
+        after ``timeout`` seconds.
+        """
+        if self._session is None:
+            raise RuntimeError("HttpClient.start() has not been called")
+        limit = max_bytes or self.max_download_bytes
+
+        async with self._session.get(url, params=params, headers=headers) as response:
+            if raise_for_status:
+                response.raise_for_status()
+            if response.content_length is not None and response.content_length > limit:
+                raise DownloadTooLarge(
+                    f"{response.content_length} bytes is over the {limit} byte limit"
+                )
+            body = bytearray()
+            async for chunk in response.content.iter_chunked(_CHUNK_SIZE):
+                body += chunk
+                if len(body) > limit:
+                    raise DownloadTooLarge(f"Response is over the {limit} byte limit")
+            return bytes(body), response.content_type, response.status
+
+    async def get_json(self, url, params=None, headers=None):
+        """GET ``url`` and decode its JSON body, whatever the status code
+        (APIs such as OpenWeatherMap report errors inside the JSON)."""
+        body, _, _ = await self.fetch(
+            url, params=params, headers=headers, max_bytes=1024 * 1024,
+            raise_for_status=False,
+        )
+        return json.loads(body)
@@ -0,0 +1,700 @@
+"""Pillow rendering for the image context menus.
+
+Every public function takes and returns plain bytes so it can run in a
+RenderEngine worker process (see utils/render.py). Errors meant for the
+user are raised as ImageError.
+
+Inputs are checked against a budget (IMAGE_* and GIF_* in config.py) from
+their header, before any pixel is decoded: huge images are refused or
+decoded at a reduced scale, and everything is shrunk to an output bound
+before drawing.
+"""
+
+import io
+import logging
+import os
+from functools import lru_cache
+
+import numpy as np
+from PIL import GifImagePlugin, Image, ImageDraw, ImageFont, ImageSequence, features
+
+from config import (
+    IMAGE_MAX_INPUT_PIXELS,
+    IMAGE_MAX_OUTPUT_SIZE,
+    GIF_MAX_INPUT_PIXELS,
+    GIF_MAX_OUTPUT_SIZE,
+    GIF_MAX_FRAMES,
+    ANIMATION_FORMATS,
+)
+
+FONT_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "Roboto-Bold.ttf"
+)
+
+# Discord's upload limits
+EMOJI_MAX_BYTES = 256 * 1024
+STICKER_MAX_BYTES = 512 * 1024
+
+# Output formats
+PNG = "PNG"
+WEBP = "WEBP"
+JPEG = "JPEG"
+GIF = "GIF"
+APNG = "APNG"
+EXTENSIONS = {PNG: "png", WEBP: "webp", JPEG: "jpg", GIF: "gif", APNG: "png"}
+# Lowest lossy quality used before the image is scaled down instead
+MIN_QUALITY = 50
+# Animated emoji keep at least this many frames before losing colours
+EMOJI_MIN_FRAMES = 8
+# Fewest palette colours tried for an animated emoji
+EMOJI_MIN_COLORS = 16
+
+# Frames sampled, evenly spread over the GIF, to build its shared palette
+PALETTE_SAMPLES = 16
+# Sampled frames are shrunk to fit this box before the palette is built
+PALETTE_SAMPLE_SIZE = 160
+# Our GIFs store every frame in full, so they are rarely smaller than the
+# source GIF (scaled to the output). A GIF is not encoded when another
+# format already came out under this fraction of that size
+GIF_SKIP_RATIO = 0.75
+# Pillow's APNG writer holds every frame in memory before writing (unlike
+# its WebP writer and our GIF writer), so longer or larger animations are
+# not tried as APNG: about 48 MB of RGB frames
+APNG_MAX_PIXELS = 16_000_000
+
+# Part of every render cache key: bump it whenever a change alters what the
+# renderers output, so renders cached by older code are not served
+RENDERER_VERSION = 3
+
+
+class ImageError(ValueError):
+    """Rendering failed in a way worth telling the user about."""
+
+
+def init_worker():
+    """Load Pillow's codecs and the font once per worker, not once per job."""
+    Image.init()
+    load_font(FONT_PATH, 60)
+
+
+@lru_cache(maxsize=64)
+def load_font(path, size):
+    """FreeTypeFont for (path, size); loading the TTF is the slow part."""
+    return ImageFont.truetype(path, size)
+
+
+# textbbox only depends on the font and the text, never on the target image
+_MEASURE = ImageDraw.Draw(Image.new("RGBA", (1, 1)))
+
+
+def _text_size(text, font):
+    text_bbox = _MEASURE.textbbox((0, 0), text, font=font)
+    return text_bbox[2] - text_bbox[0], text_bbox[3] - text_bbox[1]
+
+
+@lru_cache(maxsize=256)
+def get_fitting_font(text, size, font_path=FONT_PATH):
+    """Largest font for ``text`` on an image of ``size``, scaled to the image.
+
+    Returns ``(font, text_width, text_height)``. Memoized, so every frame of
+    a GIF (and every image of the same size) reuses one layout.
+    """
+    width, height = size
+    min_dim = min(width, height)
+    # Base size: ~15% of smaller dimension (scales with image)
+    base_font_size = max(60, int(min_dim * 0.15))
+    base_font_size = min(280, base_font_size)  # Cap for very large images
+    min_font_size = max(24, int(min_dim * 0.05))  # Min ~5% of dimension
+
+    def fits(font_size):
+        # Allow text up to 90% width and 50% height
+        text_width, text_height = _text_size(text, load_font(font_path, font_size))
+        return text_width <= width * 0.9 and text_height <= height * 0.5
+
+    # Text size grows with font size, so binary search for the largest size
+    # that fits; like before, settle for the minimum when none does
+    font_size = base_font_size
+    if font_size > min_font_size and not fits(font_size):
+        font_size = min_font_size
+        low, high = min_font_size + 1, base_font_size - 1
+        while low <= high:
+            middle = (low + high) // 2
+            if fits(middle):
+                font_size = middle
+                low = middle + 1
+            else:
+                high = middle - 1
+
+    font = load_font(font_path, font_size)
+    return (font, *_text_size(text, font))
+
+
+def _open(data):
+    """Open ``data`` lazily: only the header is read."""
+    try:
+        return Image.open(io.BytesIO(data))
+    except Image.DecompressionBombError:
+        raise ImageError("This image is too large to process.")
+    except Exception:
+        raise ImageError(
+            "Could not open image. The URL may not point to a valid image file."
+        )
+
+
+def _fit(size, max_size):
+    """``size`` scaled down (never up) to fit ``max_size`` on its long side."""
+    width, height = size
+    scale = min(1.0, max_size / max(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def _check_pixels(size):
+    width, height = size
+    if width * height > IMAGE_MAX_INPUT_PIXELS:
+        raise ImageError(
+            f"This image is too large to process ({width}×{height}, the limit "
+            f"is {IMAGE_MAX_INPUT_PIXELS / 1e6:g} megapixels)."
+        )
+
+
+def _open_still(data, max_size=IMAGE_MAX_OUTPUT_SIZE):
+    """Open a still image within the input budget, at most ``max_size`` on
+    its long side. JPEGs are decoded straight at a reduced scale."""
+    img = _open(data)
+    try:
+        if img.format == "JPEG":
+            # Lets libjpeg decode at 1/2, 1/4 or 1/8 scale; header only so far
+            img.draft(None, _fit(img.size, max_size))
+        _check_pixels(img.size)
+        if max(img.size) > max_size:
+            if img.mode in ("1", "P"):
+                # Palette images would be resized with NEAREST
+                img = img.convert("RGBA")
+            # reducing_gap shrinks with reduce() first, then Lanczos
+            img.thumbnail((max_size, max_size), Image.LANCZOS, reducing_gap=3.0)
+    except Exception:
+        img.close()
+        raise
+    return img
+
+
+def render_text_image(data, text):
+    """Write ``text`` in the middle of a still image. Returns PNG bytes."""
+    with _open_still(data) as img:
+        draw = ImageDraw.Draw(img)
+        font, text_width, text_height = get_fitting_font(text, img.size)
+        x = (img.width - text_width) / 2
+        y = (img.height - text_height) / 2
+        draw.text((x, y), text, fill="white", font=font)
+
+        output_buffer = io.BytesIO()
+        img.save(output_buffer, format="PNG")
+        return output_buffer.getvalue()
+
+
+def _text_mask(size, text):
+    """Coverage (0-255) of ``text`` centred on an image of ``size``."""
+    font, text_width, text_height = get_fitting_font(text, size)
+    mask = Image.new("L", size, 0)
+    x = (size[0] - text_width) / 2
+    y = (size[1] - text_height) / 2
+    ImageDraw.Draw(mask).text((x, y), text, fill=255, font=font)
+    return np.asarray(mask, dtype=np.uint16)
+
+
+def _overlay_frame(frame, inverse_mask):
+    """Shrink ``frame`` to the mask's size, flatten it onto white and draw
+    the white text over it.
+
+    ``inverse_mask`` is ``255 - _text_mask(...)``. The background and the
+    text are both white, so one weight per pixel says how much of the
+    frame's own colour is left.
+    """
+    frame = frame.convert("RGBA")
+    size = inverse_mask.shape[1], inverse_mask.shape[0]
+    if frame.size != size:
+        frame = frame.resize(size, Image.LANCZOS, reducing_gap=2.0)
+    rgba = np.asarray(frame, dtype=np.uint16)
+    weight = (rgba[..., 3] * inverse_mask // 255)[..., None]
+    rgb = (rgba[..., :3] * weight + 255 * (255 - weight) + 127) // 255
+    return Image.fromarray(rgb.astype(np.uint8), "RGB")
+
+
+class _OverlayFrames(Image.Image):
+    """The frames of a GIF with the text overlaid, as a lazy multi-frame image.
+
+    Frames are decoded and overlaid only when seeked to, so encoders that
+    walk through an image sequence (ours for GIF, Pillow's for animated
+    WebP) never need all of them in memory. Pillow's APNG writer copies
+    every frame first, see APNG_MAX_PIXELS. Only every ``step``-th source
+    frame is kept.
+
+    The frames sampled for the GIF palette are kept in ``samples`` as they
+    go by, so an earlier encode saves _global_palette a pass over the GIF.
+    """
+
+    def __init__(self, source, inverse_mask, step):
+        super().__init__()
+        self._source = source
+        self._inverse_mask = inverse_mask
+        self._step = step
+        self._frame = None
+        self.n_frames = -(-getattr(source, "n_frames", 1) // step)
+        self.is_animated = self.n_frames > 1
+        count = min(self.n_frames, PALETTE_SAMPLES)
+        self.samples = dict.fromkeys(sorted({i * self.n_frames // count for i in range(count)}))
+        self.seek(0)
+
+    def seek(self, frame):
+        if not 0 <= frame < self.n_frames:
+            raise EOFError("no more frames")
+        if frame != self._frame:
+            self._source.seek(frame * self._step)
+            rendered = _overlay_frame(self._source, self._inverse_mask)
+            if frame in self.samples and self.samples[frame] is None:
+                sample = rendered.copy()
+                # NEAREST keeps the colours the frames really use
+                sample.thumbnail((PALETTE_SAMPLE_SIZE, PALETTE_SAMPLE_SIZE), Image.NEAREST)
+                self.samples[frame] = sample
+            self.im = rendered.im
+            self._mode = rendered.mode
+            self._size = rendered.size
+            self._frame = frame
+
+    def tell(self):
+        return self._frame
+
+
+def _check_gif(img):
+    """Check a GIF against the budget from its headers alone.
+
+    Returns the step that keeps at most GIF_MAX_FRAMES of its frames.
+    """
+    if img.format != "GIF":
+        raise ImageError("Not a valid GIF format")
+    width, height = img.size
+    _check_pixels(img.size)
+    frame_count = getattr(img, "n_frames", 1)
+    if frame_count * width * height > GIF_MAX_INPUT_PIXELS:
+        raise ImageError(
+            f"This GIF is too large to process ({frame_count} frames of "
+            f"{width}×{height})."
+        )
+    return -(-frame_count // GIF_MAX_FRAMES)
+
+
+def _gif_durations(data):
+    """How long each frame of a GIF is shown, in ms, read from the blocks
+    around the image data: unlike seeking through the frames with Pillow,
+    no pixel is decoded. Frames without a delay get 100 ms, like Pillow's
+    default."""
+    durations = []
+    duration = None
+    position = 13  # header and logical screen descriptor
+    if data[10] & 0x80:
+        position += 3 << ((data[10] & 7) + 1)  # global colour table
+    while position < len(data):
+        block = data[position]
+        if block == 0x21:  # extension
+            label = data[position + 1]
+            position += 2
+            if label == 0xF9 and position + 4 < len(data):  # graphic control
+                duration = int.from_bytes(data[position + 2:position + 4], "little") * 10
+        elif block == 0x2C:  # image descriptor
+            flags = data[position + 9] if position + 9 < len(data) else 0
+            position += 10
+            if flags & 0x80:
+                position += 3 << ((flags & 7) + 1)  # local colour table
+            position += 1  # LZW minimum code size
+            durations.append(100 if duration is None else duration)
+            duration = None
+        else:  # trailer, or garbage after the last frame
+            break
+        # Skip the data sub-blocks, up to the empty one that ends them
+        while position < len(data) and data[position]:
+            position += data[position] + 1
+        position += 1
+    return durations
+
+
+def _open_gif(data, img, text):
+    """Check a GIF against the budget and plan its output.
+
+    Returns ``(frames, durations)``: the overlaid frames (shrunk to
+    GIF_MAX_OUTPUT_SIZE, every n-th frame past GIF_MAX_FRAMES) and how long
+    each is shown, including the frames it stands for.
+    """
+    step = _check_gif(img)
+    frame_count = getattr(img, "n_frames", 1)
+    # Pillow counted the frames itself; trust it over a damaged file
+    frame_durations = _gif_durations(data)[:frame_count]
+    frame_durations += [100] * (frame_count - len(frame_durations))
+    durations = [
+        sum(frame_durations[index:index + step])
+        for index in range(0, frame_count, step)
+    ]
+
+    # GIF frames all have the canvas size, so one text mask serves them all
+    inverse_mask = 255 - _text_mask(_fit(img.size, GIF_MAX_OUTPUT_SIZE), text)
+    return _OverlayFrames(img, inverse_mask, step), durations
+
+
+def _global_palette(frames, method):
+    """One palette for the whole GIF, built from a sample of its frames."""
+    for index, sample in frames.samples.items():
+        if sample is None:
+            # Not seen by an earlier encode: seeking keeps it
+            frames.seek(index)
+    samples = list(frames.samples.values())
+
+    width, height = samples[0].size
+    montage = Image.new("RGB", (width, height * len(samples)))
+    for i, sample in enumerate(samples):
+        montage.paste(sample, (0, i * height))
+    return montage.quantize(colors=256, method=method)
+
+
+def _write_gif_frame(fp, frame, **params):
+    chunks = GifImagePlugin.getdata(frame, **params)
+    fp.write(b"".join(chunks))
+    # Some Pillow versions collect into one list shared by every call
+    chunks.clear()
+
+
+def _encode_gif(frames, durations, loop):
+    """Stream ``frames`` into a GIF: each one is quantized and written
+    before the next is rendered. All frames share one palette, built from
+    frames sampled across the whole GIF."""
+    # RGB images only support Median Cut, Max Coverage, Fast Octree or libimagequant.
+    # Use Fast Octree - no extra deps, good quality with FLOYDSTEINBERG dithering.
+    try:
+        method = Image.Quantize.FASTOCTREE
+        dither = Image.Dither.FLOYDSTEINBERG
+    except AttributeError:
+        method = Image.FASTOCTREE
+        dither = Image.FLOYDSTEINBERG
+
+    palette = _global_palette(frames, method)
+    output_buffer = io.BytesIO()
+    for index, frame in enumerate(ImageSequence.Iterator(frames)):
+        quantized = frame.quantize(palette=palette, dither=dither)
+        if index == 0:
+            header, _ = GifImagePlugin.getheader(
+                quantized, info={"loop": loop, "optimize": False}
+            )
+            output_buffer.write(b"".join(header))
+        # Every frame covers the whole canvas
+        _write_gif_frame(
+            output_buffer, quantized, duration=durations[index], disposal=2
+        )
+    output_buffer.write(b";")  # GIF trailer
+    return output_buffer.getvalue()
+
+
+def _encode_animation(frames, durations, loop, fmt):
+    output_buffer = io.BytesIO()
+    frames.seek(0)
+    if fmt == WEBP:
+        frames.save(
+            output_buffer, format="WEBP", save_all=True, duration=durations,
+            loop=loop, quality=80, method=4,
+        )
+    else:
+        frames.save(
+            output_buffer, format="PNG", save_all=True, duration=durations,
+            loop=loop, optimize=True,
+        )
+    return output_buffer.getvalue()
+
+
+def render_text_gif(data, text):
+    """Write ``text`` in the middle of every frame of a GIF. Returns GIF bytes.
+
+    Frames are streamed, so memory depends on the frame size and not on the
+    number of frames.
+    """
+    with _open(data) as img:
+        frames, durations = _open_gif(data, img, text)
+        return _encode_gif(frames, durations, img.info.get("loop", 0))
+
+
+def _beats_gif(data, img, frames, candidates):
+    """Whether a candidate is smaller than GIF_SKIP_RATIO times the source
+    GIF, scaled to the pixels of the output."""
+    source_pixels = img.width * img.height * getattr(img, "n_frames", 1)
+    output_pixels = frames.width * frames.height * frames.n_frames
+    expected = len(data) * output_pixels / source_pixels
+    return min(len(output) for output, _ in candidates) < expected * GIF_SKIP_RATIO
+
+
+def render_text_animation(data, text, formats=ANIMATION_FORMATS):
+    """Like render_text_gif, but encoded in each of ``formats`` (GIF, WEBP,
+    APNG) and returned as ``(bytes, extension)`` in the smallest one.
+
+    GIF is the fallback when the other formats are unavailable or fail, and
+    is skipped when another format is already far smaller than the source
+    (see GIF_SKIP_RATIO): each format is a full pass over the frames. APNG
+    is only tried up to APNG_MAX_PIXELS.
+    """
+    with _open(data) as img:
+        frames, durations = _open_gif(data, img, text)
+        loop = img.info.get("loop", 0)
+
+        output_pixels = frames.width * frames.height * frames.n_frames
+        candidates = []
+        for fmt in formats:
+            if fmt not in (WEBP, APNG) or (fmt == WEBP and not features.check("webp")):
+                continue
+            if fmt == APNG and output_pixels > APNG_MAX_PIXELS:
+                continue
+            try:
+                candidates.append((_encode_animation(frames, durations, loop, fmt), fmt))
+            except Exception as e:
+                logging.warning(f"Could not encode animated {fmt}: {e}")
+        if not candidates or (
+            GIF in formats and not _beats_gif(data, img, frames, candidates)
+        ):
+            candidates.append((_encode_gif(frames, durations, loop), GIF))
+
+        output, fmt = min(candidates, key=lambda candidate: len(candidate[0]))
+        return output, EXTENSIONS[fmt]
+
+
+def _has_alpha(img):
+    if img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info:
+        return img.convert("RGBA").getextrema()[3][0] < 255
+    return False
+
+
+def _encode(img, fmt, quality=None):
+    """``img`` as ``fmt`` bytes; ``quality`` None means lossless."""
+    output_buffer = io.BytesIO()
+    if fmt == PNG:
+        img.save(output_buffer, format="PNG", optimize=True)
+    elif fmt == WEBP:
+        if quality is None:
+            img.save(output_buffer, format="WEBP", lossless=True)
+        else:
+            img.save(output_buffer, format="WEBP", quality=quality, method=4)
+    else:
+        img.convert("RGB").save(
+            output_buffer, format="JPEG", quality=quality, optimize=True
+        )
+    return output_buffer.getvalue()
+
+
+def _highest_quality(img, fmt, max_bytes):
+    """Binary search the highest quality in [MIN_QUALITY, 95] that fits.
+
+    Returns ``(quality, data)``, or None when even MIN_QUALITY is too big.
+    """
+    best = None
+    low, high = MIN_QUALITY, 95
+    while low <= high:
+        quality = (low + high) // 2
+        data = _encode(img, fmt, quality)
+        if len(data) <= max_bytes:
+            best = quality, data
+            low = quality + 1
+        else:
+            high = quality - 1
+    return best
+
+
+def _encode_at_scale(img, max_bytes, formats, lossy):
+    """Best encoding of ``img`` as it is, or None when nothing fits."""
+    # Lossless first: the smallest lossless file that fits
+    lossless = [(_encode(img, fmt), fmt) for fmt in formats if fmt in (PNG, WEBP)]
+    fits = [candidate for candidate in lossless if len(candidate[0]) <= max_bytes]
+    if fits:
+        return min(fits, key=lambda candidate: len(candidate[0]))
+
+    if PNG in formats:
+        palette_png = _encode(img.quantize(256, method=Image.Quantize.FASTOCTREE), PNG)
+        if len(palette_png) <= max_bytes:
+            return palette_png, PNG
+
+    # Lossy: whichever format fits at the highest quality, then the smallest
+    best = None
+    for fmt in lossy:
+        found = _highest_quality(img, fmt, max_bytes)
+        if found is not None and (
+            best is None or (found[0], -len(found[1])) > (best[0], -len(best[1]))
+        ):
+            best = (*found, fmt)
+    if best is not None:
+        return best[1], best[2]
+    return None
+
+
+def _fits_when_scaled(img, scale, max_bytes, lossy):
+    """Whether ``img`` at ``scale`` percent fits with the cheapest encoding."""
+    scaled = img.resize(_fit(img.size, max(img.size) * scale // 100), Image.LANCZOS)
+    if lossy:
+        return any(len(_encode(scaled, fmt, MIN_QUALITY)) <= max_bytes for fmt in lossy)
+    palette = scaled.quantize(256, method=Image.Quantize.FASTOCTREE)
+    return len(_encode(palette, PNG)) <= max_bytes
+
+
+def encode_to_budget(img, max_bytes, formats=(PNG, WEBP, JPEG)):
+    """Encode ``img`` in at most ``max_bytes``; returns ``(data, extension)``.
+
+    Goes from best to worst quality: lossless PNG/WebP, a 256-colour PNG,
+    then lossy WebP/JPEG at the highest quality that fits (binary search).
+    If even MIN_QUALITY is too big, the largest scale that fits is found by
+    binary search and the image is encoded again at that scale.
+    """
+    formats = [fmt for fmt in formats if fmt != WEBP or features.check("webp")]
+    alpha = _has_alpha(img)
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if alpha else "RGB")
+    # JPEG would lose the transparency
+    lossy = [fmt for fmt in formats if fmt == WEBP or (fmt == JPEG and not alpha)]
+
+    encoded = _encode_at_scale(img, max_bytes, formats, lossy)
+    if encoded is None:
+        low, high, scale = 1, 99, None
+        while low <= high:
+            middle = (low + high) // 2
+            if _fits_when_scaled(img, middle, max_bytes, lossy):
+                scale = middle
+                low = middle + 1
+            else:
+                high = middle - 1
+        if scale is not None:
+            img = img.resize(_fit(img.size, max(img.size) * scale // 100), Image.LANCZOS)
+            encoded = _encode_at_scale(img, max_bytes, formats, lossy)
+    if encoded is None:
+        raise ImageError(f"Could not make this image fit in {max_bytes // 1024} KB.")
+    data, fmt = encoded
+    return data, EXTENSIONS[fmt]
+
+
+def resize_emoji(data):
+    """Shrink an image to fit 128x128 for a custom emoji, encoded under
+    Discord's emoji size limit. Returns ``(bytes, extension)``."""
+    with _open_still(data, max_size=128) as img:
+        img.thumbnail((128, 128), Image.LANCZOS)
+        return encode_to_budget(img, EMOJI_MAX_BYTES)
+
+
+def compress_sticker(data):
+    """Re-encode an image under Discord's sticker size limit, as a PNG
+    (stickers can't be JPEG or WebP). Returns ``(bytes, extension)``."""
+    with _open_still(data) as img:
+        return encode_to_budget(img, STICKER_MAX_BYTES, formats=(PNG,))
+
+
+def _first_fit(options, encode, max_bytes):
+    """Binary search ``options`` (best first, each encoding no bigger than
+    the one before) for the first whose ``encode`` fits in ``max_bytes``.
+
+    Returns ``(option, data)``, or None when even the last one is too big.
+    """
+    found = None
+    low, high = 0, len(options) - 1
+    while low <= high:
+        middle = (low + high) // 2
+        data = encode(options[middle])
+        if len(data) <= max_bytes:
+            found = options[middle], data
+            high = middle - 1
+        else:
+            low = middle + 1
+    return found
+
+
+def _encode_emoji_gif(frames, durations, loop, step, colors):
+    """Every ``step``-th frame as a GIF with a shared ``colors`` palette,
+    keeping 1-bit transparency."""
+    kept = frames[::step]
+    kept_durations = [sum(durations[i:i + step]) for i in range(0, len(frames), step)]
+    opaque = [np.asarray(frame)[..., 3] >= 128 for frame in kept]
+    transparent = not all(mask.all() for mask in opaque)
+    # The last index is kept for transparency
+    palette_colors = colors - 1 if transparent else colors
+
+    count = min(len(kept), PALETTE_SAMPLES)
+    samples = [kept[i * len(kept) // count].convert("RGB") for i in range(count)]
+    width, height = samples[0].size
+    montage = Image.new("RGB", (width, height * len(samples)))
+    for i, sample in enumerate(samples):
+        montage.paste(sample, (0, i * height))
+    palette = montage.quantize(palette_colors, method=Image.Quantize.FASTOCTREE)
+    palette_values = palette.getpalette()[:palette_colors * 3]
+    # Padded, so the transparency index exists even with fewer colours
+    palette_values += [0] * (palette_colors * 3 - len(palette_values))
+    if transparent:
+        palette_values += [0, 0, 0]
+
+    quantized = []
+    for frame, mask in zip(kept, opaque):
+        indices = np.array(
+            frame.convert("RGB").quantize(palette=palette, dither=Image.Dither.FLOYDSTEINBERG)
+        )
+        if transparent:
+            indices[~mask] = palette_colors
+        frame = Image.fromarray(indices, "P")
+        frame.putpalette(palette_values)
+        quantized.append(frame)
+
+    output_buffer = io.BytesIO()
+    params = {"transparency": palette_colors} if transparent else {}
+    quantized[0].save(
+        output_buffer,
+        format="GIF",
+        save_all=True,
+        append_images=quantized[1:],
+        duration=kept_durations,
+        loop=loop,
+        disposal=2,
+        **params,
+    )
+    return output_buffer.getvalue()
+
+
+def resize_animated_emoji(data):
+    """Shrink an animated GIF to fit 128x128 for an animated emoji, under
+    Discord's emoji size limit. Returns ``(bytes, extension)``.
+
+    When the GIF is too big, frames are dropped first (the smallest step
+    that fits, by binary search, keeping at least EMOJI_MIN_FRAMES), then
+    palette colours (the most that fit, by binary search). Still images
+    go through resize_emoji.
+    """
+    with _open(data) as img:
+        if not getattr(img, "is_animated", False):
+            return resize_emoji(data)
+        step = _check_gif(img)
+        loop = img.info.get("loop", 0)
+
+        # Frames are 128 px at most, so keeping them all is cheap
+        frames = []
+        durations = []
+        for index, frame in enumerate(ImageSequence.Iterator(img)):
+            duration = frame.info.get("duration", img.info.get("duration", 100))
+            if index % step:
+                durations[-1] += duration
+                continue
+            frame = frame.convert("RGBA")
+            frame.thumbnail((128, 128), Image.LANCZOS)
+            frames.append(frame)
+            durations.append(duration)
+
+    max_step = max(1, len(frames) // EMOJI_MIN_FRAMES)
+    found = _first_fit(
+        list(range(1, max_step + 1)),
+        lambda step: _encode_emoji_gif(frames, durations, loop, step, 256),
+        EMOJI_MAX_BYTES,
+    )
+    if found is None:
+        found = _first_fit(
+            list(range(255, EMOJI_MIN_COLORS - 1, -1)),
+            lambda colors: _encode_emoji_gif(frames, durations, loop, max_step, colors),
+            EMOJI_MAX_BYTES,
+        )
+    if found is None:
+        raise ImageError(
+            f"Could not make this GIF fit in {EMOJI_MAX_BYTES // 1024} KB as an emoji."
+        )
+    return found[1], EXTENSIONS[GIF]
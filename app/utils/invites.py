@@ -0,0 +1,87 @@
+"""Pool of pre-created single-use invites, so handing one out costs no API call."""
+
+import asyncio
+import logging
+
+from utils.actions import channel_bucket
+
+
+class InvitePool:
+    """Keep ``size`` unused single-use, never-expiring invites per channel.
+
+    ``take`` hands out a pooled invite (creating one inline only when the
+    pool is empty) and refills the pool in the background. Unused invites are
+    deleted on ``close`` so restarts don't leave them piling up in the guild.
+    """
+
+    def __init__(self, executor, size=2):
+        self.executor = executor
+        self.size = size
+        self._invites = {}
+        self._refills = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def warm(self, channel):
+        """Start filling the pool for ``channel`` if it isn't already."""
+        if channel is None or self.size <= 0:
+            return
+        self._invites.setdefault(channel.id, [])
+        task = self._refills.get(channel.id)
+        if task is None or task.done():
+            self._refills[channel.id] = asyncio.create_task(
+                self._refill(channel), name=f"invite-pool-{channel.id}"
+            )
+
+    async def take(self, channel, reason=None):
+        pool = self._invites.get(channel.id)
+        if pool:
+            self.hits += 1
+            invite = pool.pop()
+        else:
+            self.misses += 1
+            invite = await self._create(channel, reason)
+        self.warm(channel)
+        return invite
+
+    async def close(self):
+        tasks = list(self._refills.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._refills = {}
+
+        for pool in self._invites.values():
+            for invite in pool:
+                try:
+                    await invite.delete(reason="Unused pooled invite")
+                except Exception as e:
+                    logging.warning(f"Could not delete pooled invite {invite.code}: {e}")
+        self._invites = {}
+
+    def stats(self):
+        return {
+            "pooled": sum(len(pool) for pool in self._invites.values()),
+            "channels": len(self._invites),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    async def _create(self, channel, reason=None):
+        return await self.executor.run(
+            channel_bucket(channel),
+            channel.create_invite,
+            max_age=0,
+            max_uses=1,
+            unique=True,
+            reason=reason,
+        )
+
+    async def _refill(self, channel):
+        pool = self._invites[channel.id]
+        try:
+            while len(pool) < self.size:
+                pool.append(await self._create(channel, reason="Invite pool"))
+        except Exception as e:
+            logging.error(f"Failed to fill invite pool for #{channel}: {e}")
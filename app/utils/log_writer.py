@@ -0,0 +1,132 @@
+"""Write-behind batch writer for message_logs."""
+
+import asyncio
+import logging
+
+from config import LOG_BATCH_SIZE, LOG_FLUSH_INTERVAL_MS, LOG_QUEUE_MAX_SIZE
+from database import log_messages_to_db
+
+
+class MessageLogWriter:
+    """Queue log entries in memory and flush them to the database in batches.
+
+    A batch is written as soon as ``batch_size`` entries are pending, or
+    ``flush_interval_ms`` after its first entry arrived, whichever comes first.
+    When the queue is full new entries are dropped rather than blocking the
+    caller, and counted in ``stats()``.
+    """
+
+    def __init__(
+        self,
+        batch_size=LOG_BATCH_SIZE,
+        flush_interval_ms=LOG_FLUSH_INTERVAL_MS,
+        max_queue_size=LOG_QUEUE_MAX_SIZE,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self._queue = asyncio.Queue(maxsize=max_queue_size)
+        self._batch_ready = asyncio.Event()
+        self._task = None
+        self._batch = None  # taken from the queue, not written yet
+        self._closing = False
+
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.high_water_mark = 0
+        self.last_flush_ms = 0.0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="message-log-writer")
+
+    async def close(self):
+        """Stop the background task and flush whatever is still queued."""
+        if self._task is not None:
+            # A batch the task already holds is written by the task itself;
+            # cancelling is only safe while it waits for the first entry
+            self._closing = True
+            self._batch_ready.set()
+            if self._batch is None:
+                self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        while not self._queue.empty():
+            batch = []
+            self._drain_into(batch)
+            await self._write(batch)
+
+    def submit(self, message_data):
+        """Queue an entry without waiting. Returns False if it was dropped."""
+        try:
+            self._queue.put_nowait(message_data)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logging.warning(
+                    f"Message log queue is full, {self.dropped} entries dropped so far"
+                )
+            return False
+
+        self.enqueued += 1
+        depth = self._queue.qsize()
+        if depth > self.high_water_mark:
+            self.high_water_mark = depth
+        if depth >= self.batch_size:
+            self._batch_ready.set()
+        return True
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "written": self.written,
+            "failed": self.failed,
+            "batches": self.batches,
+            "high_water_mark": self.high_water_mark,
+            "last_flush_ms": round(self.last_flush_ms, 1),
+        }
+
+    def _drain_into(self, batch):
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+
+    async def _run(self):
+        while not self._closing:
+            self._batch = batch = [await self._queue.get()]
+            self._drain_into(batch)
+            if len(batch) < self.batch_size and not self._closing:
+                # Let the batch fill up, unless it does so before the interval ends
+                self._batch_ready.clear()
+                try:
+                    await asyncio.wait_for(
+                        self._batch_ready.wait(), timeout=self.flush_interval
+                    )
+                except asyncio.TimeoutError:
+                    pass
+                self._drain_into(batch)
+            await self._write(batch)
+            self._batch = None
+
+    async def _write(self, batch):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        try:
+            await log_messages_to_db(batch)
+        except Exception as e:
+            self.failed += len(batch)
+            logging.error(f"Failed to write {len(batch)} message logs: {e}")
+            return
+        self.last_flush_ms = (loop.time() - start) * 1000
+        self.written += len(batch)
+        self.batches += 1
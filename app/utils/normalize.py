@@ -0,0 +1,108 @@
+"""Text normalization that undoes common tricks for dodging the word filter."""
+
+import re
+import unicodedata
+
+# Invisible characters slipped between letters ("ski​bidi")
+_INVISIBLE = (
+    0x00AD,  # soft hyphen
+    0x034F,  # combining grapheme joiner
+    0x180E,  # mongolian vowel separator
+    0x200B,  # zero width space
+    0x200C,  # zero width non-joiner
+    0x200D,  # zero width joiner
+    0x2060,  # word joiner
+    0xFEFF,  # zero width no-break space
+)
+
+# Letters from other scripts that look like Latin ones
+_HOMOGLYPHS = {
+    # Cyrillic
+    "а": "a", "в": "b", "е": "e", "ё": "e", "і": "i", "ї": "i",
+    "ј": "j", "к": "k", "м": "m", "н": "h", "о": "o", "п": "n", "р": "p",
+    "с": "c", "т": "t", "у": "y", "х": "x", "ѕ": "s", "ԁ": "d", "ԛ": "q",
+    "ԝ": "w",
+    # Greek
+    "α": "a", "β": "b", "ε": "e", "η": "n", "ι": "i", "κ": "k", "ν": "v",
+    "ο": "o", "ρ": "p", "τ": "t", "υ": "u", "χ": "x",
+    # Latin lookalikes that have no decomposition
+    "ı": "i", "ł": "l", "ø": "o", "đ": "d", "ħ": "h", "ŧ": "t", "ß": "ss",
+}
+
+# Symbols used as letters. Punctuation that also ends sentences ("!", "|")
+# is left alone so it keeps acting as a word boundary.
+_LEET = {"@": "a", "$": "s", "€": "e"}
+
+# Digits used as letters, only inside words that also have letters
+# ("sk1b1di"): numbers such as "81" must stay numbers
+_LEET_DIGITS = str.maketrans(
+    {"0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t", "8": "b"}
+)
+_DIGIT = re.compile(r"\d")
+_WORD_WITH_DIGITS = re.compile(r"\w*\d\w*")
+
+
+def _build_table():
+    mapping = dict.fromkeys(_INVISIBLE)
+    # Strip accents: map every precomposed Latin letter to its base letters
+    for start, end in ((0x00C0, 0x0250), (0x1E00, 0x1F00)):
+        for codepoint in range(start, end):
+            char = chr(codepoint)
+            base = "".join(
+                c for c in unicodedata.normalize("NFD", char)
+                if not unicodedata.combining(c)
+            )
+            if base and base != char:
+                mapping[codepoint] = base.casefold()
+    # Loose combining marks ("s̶k̶i̶" or zalgo text)
+    for codepoint in range(0x0300, 0x0370):
+        mapping[codepoint] = None
+    for source, target in {**_HOMOGLYPHS, **_LEET}.items():
+        mapping[ord(source)] = target
+
+    # A tuple indexed by code point, with unmapped characters mapping to
+    # themselves. str.translate looks every character up in the table, and a
+    # dict raises (and swallows) a KeyError for each unmapped one, which makes
+    # it several times slower.
+    table = list(range(max(mapping) + 1))
+    for codepoint, target in mapping.items():
+        table[codepoint] = target
+    return tuple(table)
+
+
+# Built once at import; str.translate then does the per-message work in C
+_TRANSLATION = _build_table()
+_RUNS = re.compile(r"(.)\1*")
+
+
+def _leet_digits(match):
+    word = match.group()
+    return word if word.isdigit() else word.translate(_LEET_DIGITS)
+
+
+def normalize_text(text):
+    """Fold text to a canonical form for banned-word matching.
+
+    NFKC folding (fullwidth and styled letters), casefolding, then a single
+    translate pass for invisible characters, accents, homoglyphs and
+    leetspeak symbols. Digits become letters only in words that also have
+    letters. Banned words must go through the same function so they
+    compare equal.
+    """
+    if not text.isascii():
+        # ASCII is already NFKC-normal, skip the (comparatively slow) call
+        text = unicodedata.normalize("NFKC", text)
+    text = text.casefold().translate(_TRANSLATION)
+    if _DIGIT.search(text):
+        text = _WORD_WITH_DIGITS.sub(_leet_digits, text)
+    return text
+
+
+def split_runs(text):
+    """Split text into runs of one repeated character: "good" -> ["g", "oo", "d"].
+
+    Running this over every message would cost more than all the other
+    normalization steps together, so BannedWordMatcher applies it to the
+    banned words instead and lets its regex accept longer runs (``goo+d``).
+    """
+    return [match.group() for match in _RUNS.finditer(text)]
@@ -0,0 +1,148 @@
+"""Staged asyncio pipeline for processing gateway events off the event handler."""
+
+import asyncio
+import logging
+
+# What a stage does when the next stage's queue is full
+DROP = "drop"  # discard the item and count it
+BLOCK = "block"  # wait for room, slowing this stage down (backpressure)
+
+
+class Stage:
+    """One step of a Pipeline: a bounded queue served by ``workers`` tasks.
+
+    ``handler(item)`` returns the item to pass on to the next stage, or None
+    to stop processing it. ``policy`` applies when this stage's queue is full
+    as the previous stage hands an item over.
+    """
+
+    def __init__(self, name, handler, workers=1, max_queue_size=1000, policy=BLOCK):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.policy = policy
+        self.queue = asyncio.Queue(maxsize=max_queue_size)
+
+        self.processed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.high_water_mark = 0
+        self.wait_ms = 0.0
+        self.run_ms = 0.0
+        self.max_run_ms = 0.0
+
+    def stats(self):
+        done = self.processed + self.failed
+        return {
+            "queued": self.queue.qsize(),
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "high_water_mark": self.high_water_mark,
+            "avg_wait_ms": round(self.wait_ms / done, 2) if done else 0.0,
+            "avg_run_ms": round(self.run_ms / done, 2) if done else 0.0,
+            "max_run_ms": round(self.max_run_ms, 2),
+        }
+
+
+class Pipeline:
+    """Chain of Stages connected by bounded queues.
+
+    ``submit`` never waits, so it is safe to call from gateway event
+    handlers: when the first stage is full the item is dropped whatever its
+    policy. Between later stages the receiving stage's policy decides.
+    """
+
+    def __init__(self, name, stages):
+        self.name = name
+        self.stages = stages
+        self._tasks = []
+
+    def start(self):
+        if self._tasks:
+            return
+        for index, stage in enumerate(self.stages):
+            next_stage = self.stages[index + 1] if index + 1 < len(self.stages) else None
+            for worker in range(stage.workers):
+                self._tasks.append(
+                    asyncio.create_task(
+                        self._work(stage, next_stage),
+                        name=f"{self.name}-{stage.name}-{worker}",
+                    )
+                )
+
+    async def close(self, timeout=5):
+        """Let queued items finish for up to ``timeout`` seconds, then stop."""
+        try:
+            for stage in self.stages:
+                await asyncio.wait_for(stage.queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"{self.name} pipeline closed with items still queued")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, item):
+        """Queue an item for the first stage. Returns False if it was dropped."""
+        stage = self.stages[0]
+        try:
+            stage.queue.put_nowait((asyncio.get_running_loop().time(), item))
+        except asyncio.QueueFull:
+            self._drop(stage)
+            return False
+        self._track_depth(stage)
+        return True
+
+    def stats(self):
+        return {stage.name: stage.stats() for stage in self.stages}
+
+    def _drop(self, stage):
+        stage.dropped += 1
+        if stage.dropped % 1000 == 1:
+            logging.warning(
+                f"{self.name} pipeline: {stage.name} queue is full, "
+                f"{stage.dropped} items dropped so far"
+            )
+
+    @staticmethod
+    def _track_depth(stage):
+        depth = stage.queue.qsize()
+        if depth > stage.high_water_mark:
+            stage.high_water_mark = depth
+
+    async def _hand_over(self, stage, item):
+        entry = (asyncio.get_running_loop().time(), item)
+        if stage.policy == BLOCK:
+            await stage.queue.put(entry)
+        else:
+            try:
+                stage.queue.put_nowait(entry)
+            except asyncio.QueueFull:
+                self._drop(stage)
+                return
+        self._track_depth(stage)
+
+    async def _work(self, stage, next_stage):
+        loop = asyncio.get_running_loop()
+        while True:
+            queued_at, item = await stage.queue.get()
+            start = loop.time()
+            stage.wait_ms += (start - queued_at) * 1000
+            try:
+                result = await stage.handler(item)
+            except Exception as e:
+                stage.failed += 1
+                result = None
+                logging.error(f"{self.name} pipeline: {stage.name} stage failed: {e}")
+            else:
+                stage.processed += 1
+            finally:
+                elapsed = (loop.time() - start) * 1000
+                stage.run_ms += elapsed
+                if elapsed > stage.max_run_ms:
+                    stage.max_run_ms = elapsed
+                stage.queue.task_done()
+
+            if result is not None and next_stage is not None:
+                await self._hand_over(next_stage, result)
@@ -0,0 +1,151 @@
+"""Process pool that runs Pillow rendering off the event loop."""
+
+import asyncio
+import logging
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from config import RENDER_WORKERS, RENDER_TIMEOUT_SECONDS
+from utils import imaging
+
+
+_HAS_ITIMER = hasattr(signal, "setitimer")
+
+
+class RenderTimeout(Exception):
+    """A render job ran longer than the engine's timeout."""
+
+
+def _on_alarm(signum, frame):
+    raise RenderTimeout()
+
+
+def _init_worker():
+    # Ctrl+C is handled by the bot, which shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if _HAS_ITIMER:
+        signal.signal(signal.SIGALRM, _on_alarm)
+    imaging.init_worker()
+
+
+def _run_job(func, args, timeout):
+    """Run in the worker: call ``func(*args)`` under a hard time limit."""
+    started = time.time()
+    if _HAS_ITIMER:
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return func(*args), started, time.time() - started
+    finally:
+        if _HAS_ITIMER:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+class RenderEngine:
+    """Run functions from utils.imaging in ``workers`` processes.
+
+    Jobs are plain functions on bytes, so nothing but bytes crosses the
+    process boundary. Each job is interrupted inside its worker after
+    ``timeout`` seconds, and the pool is replaced if a worker dies.
+    Available as ``bot.render_engine``.
+    """
+
+    def __init__(self, workers=RENDER_WORKERS, timeout=RENDER_TIMEOUT_SECONDS):
+        self.workers = workers
+        self.timeout = timeout
+        self._pool = None
+
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.wait_ms = 0.0
+        self.run_ms = 0.0
+        self.max_run_ms = 0.0
+        self.last_run_ms = 0.0
+
+    async def start(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, initializer=_init_worker
+            )
+            # Start the workers now, while the bot is still idle
+            await asyncio.gather(
+                *(self.run(imaging.init_worker) for _ in range(self.workers))
+            )
+
+    async def close(self):
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            await asyncio.to_thread(pool.shutdown, wait=True, cancel_futures=True)
+            logging.info(f"Render engine closed: {self.stats()}")
+
+    def _restart(self, broken):
+        # Every job of a broken pool fails; only the first one replaces it,
+        # and a pool closed in the meantime stays closed
+        if self._pool is not broken:
+            return
+        broken.shutdown(wait=False, cancel_futures=True)
+        logging.error("A render worker died, restarting the pool")
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers, initializer=_init_worker
+        )
+
+    async def run(self, func, *args):
+        """Await ``func(*args)`` in a worker process and return its result.
+
+        Raises RenderTimeout when the job runs longer than ``timeout``;
+        exceptions raised by ``func`` are re-raised here.
+        """
+        if self._pool is None:
+            raise RuntimeError("RenderEngine.start() has not been called")
+        loop = asyncio.get_running_loop()
+        pool = self._pool
+        submitted = time.time()
+        self.pending += 1
+        try:
+            future = loop.run_in_executor(pool, _run_job, func, args, self.timeout)
+            if _HAS_ITIMER:
+                # The worker interrupts the job itself
+                result, started, run_seconds = await future
+            else:
+                # No SIGALRM (Windows): stop waiting, the worker finishes anyway
+                result, started, run_seconds = await asyncio.wait_for(
+                    future, timeout=self.timeout
+                )
+        except (RenderTimeout, asyncio.TimeoutError):
+            self.timed_out += 1
+            raise RenderTimeout(
+                f"Rendering took longer than {self.timeout:g} seconds"
+            ) from None
+        except BrokenProcessPool:
+            self.failed += 1
+            self._restart(pool)
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.pending -= 1
+
+        self.completed += 1
+        self.wait_ms += (started - submitted) * 1000
+        self.last_run_ms = run_seconds * 1000
+        self.run_ms += self.last_run_ms
+        self.max_run_ms = max(self.max_run_ms, self.last_run_ms)
+        return result
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "pending": self.pending,
+            "queued": max(0, self.pending - self.workers),
+            "completed": self.completed,
+            "failed": self.failed,
+            "timed_out": self.timed_out,
+            "avg_wait_ms": round(self.wait_ms / self.completed, 1) if self.completed else 0.0,
+            "avg_run_ms": round(self.run_ms / self.completed, 1) if self.completed else 0.0,
+            "max_run_ms": round(self.max_run_ms, 1),
+            "last_run_ms": round(self.last_run_ms, 1),
+        }
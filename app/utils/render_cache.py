@@ -0,0 +1,190 @@
+"""Content-addressed cache of rendered images: a memory LRU in front of a disk tier."""
+
+import asyncio
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+
+from config import (
+    RENDER_CACHE_DIR,
+    RENDER_CACHE_MEMORY_BYTES,
+    RENDER_CACHE_DISK_BYTES,
+)
+
+# Disk entries are named "<64 hex key>-<filename>"
+_KEY_LENGTH = 64
+
+
+def digest(data):
+    """Source id for downloaded bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def cache_key(source, renderer, text, version):
+    """Key for ``renderer`` (a name) applied with ``text`` to ``source``.
+
+    ``source`` is a hash of the input bytes or another immutable id, such
+    as an attachment id; ``version`` keeps renders from older code out.
+    """
+    return hashlib.sha256(f"{version}\0{renderer}\0{text}\0{source}".encode()).hexdigest()
+
+
+class RenderCache:
+    """Rendered files by key, bounded in bytes in memory and on disk.
+
+    Both tiers evict the least recently used entries first. The disk tier
+    survives restarts: its index is rebuilt from the directory on ``start``,
+    oldest modification time first. Available as ``bot.render_cache``.
+    """
+
+    def __init__(
+        self,
+        directory=RENDER_CACHE_DIR,
+        memory_bytes=RENDER_CACHE_MEMORY_BYTES,
+        disk_bytes=RENDER_CACHE_DISK_BYTES,
+    ):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._memory = OrderedDict()  # key -> (data, filename)
+        self._memory_size = 0
+        self._disk = OrderedDict()  # key -> (path, filename, size)
+        self._disk_size = 0
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    async def start(self):
+        if self.disk_bytes > 0:
+            entries = await asyncio.to_thread(self._scan)
+            for key, path, filename, size in entries:
+                self._disk[key] = (path, filename, size)
+                self._disk_size += size
+            await self._evict_disk()
+            logging.info(
+                f"Render cache: {len(self._disk)} files ({self._disk_size} bytes) on disk"
+            )
+
+    async def get(self, key):
+        """Return ``(data, filename)`` for ``key``, or None."""
+        entry = self._memory.get(key)
+        if entry is not None:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return entry
+
+        disk_entry = self._disk.get(key)
+        if disk_entry is not None:
+            path, filename, _ = disk_entry
+            try:
+                data = await asyncio.to_thread(self._read, path)
+            except OSError:
+                # Evicted or removed by hand in the meantime
+                self._forget_disk(key)
+            else:
+                if key in self._disk:
+                    self._disk.move_to_end(key)
+                self._remember(key, data, filename)
+                self.disk_hits += 1
+                return data, filename
+
+        self.misses += 1
+        return None
+
+    async def put(self, key, data, filename):
+        self._remember(key, data, filename)
+        if len(data) > self.disk_bytes:
+            return
+        path = os.path.join(self.directory, f"{key}-{filename}")
+        try:
+            await asyncio.to_thread(self._write, path, data)
+        except OSError as e:
+            logging.warning(f"Could not write render cache file {path}: {e}")
+            return
+        self._forget_disk(key)
+        self._disk[key] = (path, filename, len(data))
+        self._disk_size += len(data)
+        await self._evict_disk()
+
+    def stats(self):
+        return {
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_size,
+            "disk_entries": len(self._disk),
+            "disk_bytes": self._disk_size,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+        }
+
+    def _remember(self, key, data, filename):
+        if len(data) > self.memory_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_size -= len(old[0])
+        self._memory[key] = (data, filename)
+        self._memory_size += len(data)
+        while self._memory_size > self.memory_bytes:
+            _, (evicted, _) = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    def _forget_disk(self, key):
+        entry = self._disk.pop(key, None)
+        if entry is not None:
+            self._disk_size -= entry[2]
+
+    async def _evict_disk(self):
+        paths = []
+        while self._disk_size > self.disk_bytes:
+            _, (path, _, size) = self._disk.popitem(last=False)
+            self._disk_size -= size
+            paths.append(path)
+        if paths:
+            await asyncio.to_thread(self._remove, paths)
+
+    def _scan(self):
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            name = entry.name
+            if name.endswith(".tmp"):
+                # Left over from a write that was interrupted
+                self._remove([entry.path])
+                continue
+            if len(name) <= _KEY_LENGTH + 1 or name[_KEY_LENGTH] != "-":
+                continue
+            stat = entry.stat()
+            entries.append(
+                (stat.st_mtime, name[:_KEY_LENGTH], entry.path,
+                 name[_KEY_LENGTH + 1:], stat.st_size)
+            )
+        entries.sort()
+        return [entry[1:] for entry in entries]
+
+    @staticmethod
+    def _read(path):
+        with open(path, "rb") as f:
+            data = f.read()
+        # Keep the recency order across restarts
+        os.utime(path)
+        return data
+
+    def _write(self, path, data):
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def _remove(paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,124 @@
+"""Min-heap scheduler that runs a callback when each key expires."""
+
+import asyncio
+import heapq
+import itertools
+import logging
+
+from discord.utils import utcnow
+
+# before_start() is retried this many times, this many seconds apart, before
+# the scheduler starts without it: expired keys must fire regardless
+BEFORE_START_ATTEMPTS = 5
+BEFORE_START_RETRY_SECONDS = 5
+
+
+class ExpiryScheduler:
+    """Call ``callback(key)`` once ``key``'s expiry time has passed.
+
+    Pending keys sit in a heap ordered by expiry; the background task sleeps
+    until the earliest one and is woken early when an earlier key is
+    scheduled. Keys that are already due (e.g. expired while the bot was
+    down) fire right away, at most ``max_concurrency`` callbacks at a time.
+    """
+
+    def __init__(self, callback, max_concurrency=5, name="expiry-scheduler"):
+        self._callback = callback
+        self._name = name
+        self._heap = []
+        # Latest expiry per key; heap entries that disagree with it are stale
+        self._expiries = {}
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._task = None
+        self._running = set()
+
+    def start(self, before_start=None):
+        """Start the background task, after awaiting ``before_start()`` if given."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(before_start), name=self._name)
+
+    async def close(self):
+        tasks = list(self._running)
+        if self._task is not None:
+            tasks.append(self._task)
+            self._task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def schedule(self, key, expires_at):
+        """Add ``key``, or move it to a new expiry if it is already pending."""
+        self._expiries[key] = expires_at
+        heapq.heappush(self._heap, (expires_at, next(self._counter), key))
+        if self._heap[0][2] == key:
+            self._wakeup.set()
+
+    def cancel(self, key):
+        """Forget ``key``. Returns False if it was not pending."""
+        return self._expiries.pop(key, None) is not None
+
+    def keys(self):
+        return list(self._expiries)
+
+    def expiry(self, key):
+        return self._expiries.get(key)
+
+    def __len__(self):
+        return len(self._expiries)
+
+    def __contains__(self, key):
+        return key in self._expiries
+
+    def _pop_due(self, now):
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            expires_at, _, key = heapq.heappop(self._heap)
+            if self._expiries.get(key) == expires_at:
+                del self._expiries[key]
+                due.append(key)
+        # Drop cancelled or rescheduled entries sitting on top of the heap
+        while self._heap and self._expiries.get(self._heap[0][2]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return due
+
+    async def _before_start(self, before_start):
+        for attempt in range(1, BEFORE_START_ATTEMPTS + 1):
+            try:
+                await before_start()
+                return
+            except Exception as e:
+                logging.error(
+                    f"{self._name}: before_start failed "
+                    f"(attempt {attempt}/{BEFORE_START_ATTEMPTS}): {e}"
+                )
+            if attempt < BEFORE_START_ATTEMPTS:
+                await asyncio.sleep(BEFORE_START_RETRY_SECONDS)
+        logging.error(f"{self._name}: starting without before_start")
+
+    async def _run(self, before_start):
+        if before_start is not None:
+            await self._before_start(before_start)
+        while True:
+            self._wakeup.clear()
+            now = utcnow()
+            for key in self._pop_due(now):
+                task = asyncio.create_task(self._fire(key))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+
+            timeout = None
+            if self._heap:
+                timeout = (self._heap[0][0] - now).total_seconds()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _fire(self, key):
+        async with self._semaphore:
+            try:
+                await self._callback(key)
+            except Exception as e:
+                logging.error(f"{self._name}: callback for {key} failed: {e}")
@@ -0,0 +1,62 @@
+"""Compact diffs for logged message edits, and rebuilding the versions from them."""
+
+import zlib
+from difflib import SequenceMatcher
+
+# Longer texts are logged in full: diffing them costs more than it saves
+MAX_DIFF_LENGTH = 2000
+
+
+def encode_edit(old, new):
+    """Describe ``new`` as a list of ``[start, end]`` ranges copied from
+    ``old`` and literal strings to insert, or return None when storing
+    ``new`` in full would be smaller or cheaper."""
+    if len(old) > MAX_DIFF_LENGTH or len(new) > MAX_DIFF_LENGTH:
+        return None
+    ops = []
+    size = 0
+    matcher = SequenceMatcher(None, old, new, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append([i1, i2])
+            size += 12  # roughly what a range costs in JSON
+        elif tag != "delete":
+            ops.append(new[j1:j2])
+            size += j2 - j1 + 4
+    if size >= len(new):
+        return None
+    return ops
+
+
+def checksum(text):
+    """Short fingerprint of the version a diff applies to."""
+    return f"{len(text)}:{zlib.crc32(text.encode()):08x}"
+
+
+def apply_edit(old, ops):
+    return "".join(old[op[0]:op[1]] if isinstance(op, list) else op for op in ops)
+
+
+def rebuild_versions(rows):
+    """Yield ``(row, text)`` for the log rows of one message, oldest first.
+
+    Rows with content are full versions; edit rows without content hold a
+    diff against the version before them, and the checksum of that version.
+    ``text`` is None when that version cannot be rebuilt (the message was
+    sent before logging started, or the rows it depends on were purged or
+    never written).
+    """
+    text = None
+    for row in rows:
+        extras = row["extras"]
+        if row["content"] is not None:
+            text = row["content"]
+        elif (
+            text is not None
+            and "diff" in extras
+            and extras.get("base") == checksum(text)
+        ):
+            text = apply_edit(text, extras["diff"])
+        else:
+            text = None
+        yield row, text
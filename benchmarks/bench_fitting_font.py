@@ -0,0 +1,89 @@
+"""Benchmark text layout for the image menus against the old linear font search.
+
+Run from the repository root:
+
+    python benchmarks/bench_fitting_font.py
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from PIL import Image, ImageDraw, ImageFont  # noqa: E402
+
+from utils import imaging  # noqa: E402
+
+TEXTS = [
+    "Gay",
+    "Ratio + don't care + didn't ask",
+    "Femme + Féministe + Féminisme\n+ Blue haired dragon",
+]
+SIZES = [(128, 128), (320, 240), (498, 280), (800, 600), (1920, 1080), (4032, 3024)]
+GIF_FRAMES = 60
+
+
+def old_get_fitting_font(text, image, draw, font_path):
+    """The search images.py used before: reload the TTF at every 1pt step."""
+    min_dim = min(image.size[0], image.size[1])
+    base_font_size = min(280, max(60, int(min_dim * 0.15)))
+    min_font_size = max(24, int(min_dim * 0.05))
+
+    font_size = base_font_size
+    font = ImageFont.truetype(font_path, font_size)
+    text_bbox = draw.textbbox((0, 0), text, font=font)
+    text_width = text_bbox[2] - text_bbox[0]
+    text_height = text_bbox[3] - text_bbox[1]
+    while (
+        text_width > image.size[0] * 0.9 or text_height > image.size[1] * 0.5
+    ) and font_size > min_font_size:
+        font_size -= 1
+        font = ImageFont.truetype(font_path, font_size)
+        text_bbox = draw.textbbox((0, 0), text, font=font)
+        text_width = text_bbox[2] - text_bbox[0]
+        text_height = text_bbox[3] - text_bbox[1]
+    return font, text_width, text_height
+
+
+def new_cold(text, size):
+    imaging.get_fitting_font.cache_clear()
+    imaging.load_font.cache_clear()
+    return imaging.get_fitting_font(text, size)
+
+
+def run(label, text, size, repeat=5):
+    image = Image.new("RGBA", size)
+    draw = ImageDraw.Draw(image)
+
+    old_font, old_w, old_h = old_get_fitting_font(text, image, draw, imaging.FONT_PATH)
+    new_font, new_w, new_h = imaging.get_fitting_font(text, size)
+    assert old_font.size == new_font.size and (old_w, old_h) == (new_w, new_h), label
+
+    old = min(timeit.repeat(
+        lambda: old_get_fitting_font(text, image, draw, imaging.FONT_PATH),
+        number=1, repeat=repeat,
+    ))
+    cold = min(timeit.repeat(lambda: new_cold(text, size), number=1, repeat=repeat))
+    # A GIF used to run the old search on every frame; now it is one lookup
+    gif_old = old * GIF_FRAMES
+    gif_new = min(timeit.repeat(
+        lambda: [imaging.get_fitting_font(text, size) for _ in range(GIF_FRAMES)],
+        number=1, repeat=repeat,
+    ))
+    print(
+        f"{label:<26} {new_font.size:>3}pt   old {old * 1e3:7.2f} ms   "
+        f"new {cold * 1e3:6.2f} ms   x{old / cold:5.1f}   "
+        f"{GIF_FRAMES}-frame GIF {gif_old * 1e3:8.1f} -> {gif_new * 1e3:5.2f} ms"
+    )
+
+
+def main():
+    for text in TEXTS:
+        print(repr(text))
+        for size in SIZES:
+            run(f"  {size[0]}x{size[1]}", text, size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""Benchmark peak memory of the GIF text overlay against the old all-frames-in-memory path.
+
+Each render runs in a fresh process so its peak RSS can be measured on its
+own. The test GIFs drift through the colour wheel, which is what the old
+first-frame palette handled worst. Linux only (reads /proc).
+
+Run from the repository root:
+
+    python benchmarks/bench_gif_memory.py
+"""
+
+import io
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+import numpy as np  # noqa: E402
+from PIL import Image, ImageDraw, ImageSequence  # noqa: E402
+
+from utils import imaging  # noqa: E402
+
+TEXT = "Ratio + don't care + didn't ask"
+SIZE = (480, 270)
+FRAME_COUNTS = [25, 100, 200, 400]
+
+
+def old_render_text_gif(data, text):
+    """The GIF path images.py used before: three lists of full frames."""
+    with Image.open(io.BytesIO(data)) as img:
+        method = Image.Quantize.FASTOCTREE
+        dither = Image.Dither.FLOYDSTEINBERG
+        font, text_width, text_height = imaging.get_fitting_font(text, img.size)
+        frames = []
+        durations = []
+        for frame in ImageSequence.Iterator(img):
+            durations.append(frame.info.get("duration", 100))
+            frame = frame.convert("RGBA")
+            draw = ImageDraw.Draw(frame)
+            x = (frame.width - text_width) / 2
+            y = (frame.height - text_height) / 2
+            draw.text((x, y), text, fill="white", font=font)
+            frames.append(frame.copy())
+
+        def to_rgb(f):
+            rgb = Image.new("RGB", f.size, (255, 255, 255))
+            rgb.paste(f, mask=f.split()[3])
+            return rgb
+
+        rgb_frames = [to_rgb(f) for f in frames]
+        first = rgb_frames[0].quantize(colors=256, method=method, dither=dither)
+        quantized = [first] + [f.quantize(palette=first, dither=dither) for f in rgb_frames[1:]]
+        output = io.BytesIO()
+        quantized[0].save(
+            output, format="GIF", save_all=True, append_images=quantized[1:],
+            duration=durations, loop=0, disposal=2, optimize=False,
+        )
+        return output.getvalue()
+
+
+def make_gif(frame_count):
+    """A gradient whose hue turns a full circle over the GIF, with a moving
+    bar so that no two frames are identical (Pillow would merge them)."""
+    width, height = SIZE
+    ys, xs = np.mgrid[0:height, 0:width]
+    frames = []
+    for i in range(frame_count):
+        hue = (xs * 128 // width + i * 256 // frame_count) % 256
+        hsv = np.stack(
+            [hue, np.full_like(hue, 200), 80 + ys * 175 // height], axis=-1
+        ).astype(np.uint8)
+        hsv[:, i % width, 2] = 255
+        frames.append(Image.fromarray(hsv, "HSV").convert("RGB").quantize(256))
+    output = io.BytesIO()
+    frames[0].save(
+        output, format="GIF", save_all=True, append_images=frames[1:],
+        duration=40, loop=0,
+    )
+    return output.getvalue()
+
+
+def mean_error(source, rendered):
+    """Mean absolute RGB error outside the text, streamed frame by frame."""
+    mask = imaging._text_mask(SIZE, TEXT) == 0
+    errors = []
+    with Image.open(io.BytesIO(source)) as a, Image.open(io.BytesIO(rendered)) as b:
+        for frame_a, frame_b in zip(ImageSequence.Iterator(a), ImageSequence.Iterator(b)):
+            diff = np.abs(
+                np.asarray(frame_a.convert("RGB"), dtype=np.int16)
+                - np.asarray(frame_b.convert("RGB"), dtype=np.int16)
+            )
+            errors.append(diff[mask].mean())
+    return sum(errors) / len(errors)
+
+
+def memory_kib(field):
+    """VmRSS (now) or VmHWM (peak) of this process. Unlike ru_maxrss, the
+    peak is not inherited from the parent that spawned the process."""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    raise KeyError(field)
+
+
+def child(variant, path):
+    with open(path, "rb") as f:
+        data = f.read()
+    func = old_render_text_gif if variant == "old" else imaging.render_text_gif
+    baseline = memory_kib("VmRSS")
+    started = time.perf_counter()
+    output = func(data, TEXT)
+    seconds = time.perf_counter() - started
+    peak = memory_kib("VmHWM")
+    with open(f"{path}.{variant}", "wb") as f:
+        f.write(output)
+    print(f"{(peak - baseline) / 1024:.1f} {seconds:.3f}")
+
+
+def run(variant, path):
+    result = subprocess.run(
+        [sys.executable, __file__, variant, path],
+        check=True, capture_output=True, text=True,
+    )
+    growth, seconds = result.stdout.split()
+    with open(f"{path}.{variant}", "rb") as f:
+        output = f.read()
+    os.remove(f"{path}.{variant}")
+    return float(growth), float(seconds), output
+
+
+def main():
+    print(f"{SIZE[0]}x{SIZE[1]} GIFs, peak RSS growth of the render process")
+    for frame_count in FRAME_COUNTS:
+        source = make_gif(frame_count)
+        path = f"/tmp/bench_gif_memory_{os.getpid()}.gif"
+        with open(path, "wb") as f:
+            f.write(source)
+        try:
+            for variant in ("old", "new"):
+                growth, seconds, output = run(variant, path)
+                print(
+                    f"  {frame_count:>4} frames  {variant}  {growth:7.1f} MiB"
+                    f"  {seconds:6.2f} s  {len(output) / 1024:7.0f} KiB"
+                    f"  error {mean_error(source, output):5.2f}"
+                )
+        finally:
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3:
+        child(*sys.argv[1:])
+    else:
+        main()
@@ -0,0 +1,80 @@
+"""Benchmark banned-word normalization throughput on large message batches.
+
+Run from the repository root:
+
+    python benchmarks/bench_normalize.py
+"""
+
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from config import BANNED_WORDS  # noqa: E402
+from utils.banned_words import BannedWordMatcher  # noqa: E402
+from utils.normalize import normalize_text  # noqa: E402
+
+ASCII_WORDS = (
+    "hello anyone up for a game tonight lol that was so funny did you see "
+    "the new update patch notes are out server down again ping me later"
+).split()
+FRENCH_WORDS = (
+    "salut ça va très bien merci on se fait une partie ce soir déjà vu "
+    "c'était génial à demain frère où es-tu là évidemment pourquoi pas"
+).split()
+EVASIONS = [
+    "sk1b1di",
+    "ｓｋｉｂｉｄｉ",
+    "ski​bi‍di",
+    "skiiiibiiiidi",
+    "ѕkіbіdі",
+    "SKÌBÏDÏ",
+    "r0bl0x",
+    "qu0icou",
+]
+
+
+def make_batch(words, count, seed, evasion_rate=0.0):
+    rng = random.Random(seed)
+    batch = []
+    for _ in range(count):
+        message = rng.choices(words, k=rng.randint(3, 40))
+        if rng.random() < evasion_rate:
+            message.insert(rng.randrange(len(message) + 1), rng.choice(EVASIONS))
+        batch.append(" ".join(message))
+    return batch
+
+
+def run(label, batch, func, repeat=5):
+    seconds = min(timeit.repeat(lambda: [func(m) for m in batch], number=1, repeat=repeat))
+    chars = sum(len(m) for m in batch)
+    print(
+        f"{label:<34} {seconds / len(batch) * 1e6:6.2f} µs/msg"
+        f"   {chars / seconds / 1e6:6.1f} M chars/s"
+    )
+
+
+def main():
+    matcher = BannedWordMatcher.from_words(BANNED_WORDS)
+    batches = {
+        "ASCII chat": make_batch(ASCII_WORDS, 50000, seed=1),
+        "French chat (accents)": make_batch(FRENCH_WORDS, 50000, seed=2),
+        "10% evasion attempts": make_batch(FRENCH_WORDS, 50000, seed=3, evasion_rate=0.1),
+    }
+
+    print("normalize_text")
+    for label, batch in batches.items():
+        run(f"  {label}", batch, normalize_text)
+
+    print("normalize_text + match")
+    for label, batch in batches.items():
+        run(f"  {label}", batch, matcher.find)
+
+    caught = sum(matcher.find(m) is not None for m in batches["10% evasion attempts"])
+    print(f"evasion batch: {caught} of {len(batches['10% evasion attempts'])} messages flagged")
+
+
+if __name__ == "__main__":
+    main()